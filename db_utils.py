@@ -2,8 +2,35 @@ import sqlite3
 
 DB_FILE = "bot_usage.db"
 
-def init_db():
+# Requests per canonical media key (media_keys.media_key), e.g. "instagram:C1a2B3c4"
+MEDIA_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS media (
+    media_key TEXT PRIMARY KEY,
+    platform TEXT,
+    request_count INTEGER DEFAULT 0,
+    first_seen TEXT DEFAULT CURRENT_TIMESTAMP,
+    last_seen TEXT DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+_wal_enabled = False
+
+def _connect():
+    """
+    Open the database. Once per process: switch it to WAL so dashboard readers don't block writes,
+    and create tables added after the initial schema (existing databases aren't re-initialized).
+    """
+    global _wal_enabled
     conn = sqlite3.connect(DB_FILE)
+    if not _wal_enabled:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(MEDIA_TABLE_SQL)
+        conn.commit()
+        _wal_enabled = True
+    return conn
+
+def init_db():
+    conn = _connect()
     cursor = conn.cursor()
 
     # Table for users
@@ -37,11 +64,13 @@ def init_db():
     )
     """)
 
+    cursor.execute(MEDIA_TABLE_SQL)
+
     conn.commit()
     conn.close()
 
 def log_user_start(user_id, username, full_name):
-    conn = sqlite3.connect(DB_FILE)
+    conn = _connect()
     cursor = conn.cursor()
     cursor.execute("""
     INSERT INTO users (user_id, username, full_name, start_count)
@@ -52,7 +81,7 @@ def log_user_start(user_id, username, full_name):
     conn.close()
 
 def log_chat_usage(chat_id, chat_title):
-    conn = sqlite3.connect(DB_FILE)
+    conn = _connect()
     cursor = conn.cursor()
     cursor.execute("""
     INSERT INTO chats (chat_id, chat_title)
@@ -62,8 +91,8 @@ def log_chat_usage(chat_id, chat_title):
     conn.commit()
     conn.close()
 
-def log_activity(user_id, chat_id, instagram=False, youtube=False, twitter=False, tiktok=False):
-    conn = sqlite3.connect(DB_FILE)
+def log_activity(user_id, chat_id, instagram=False, youtube=False, twitter=False, tiktok=False, media_key=None):
+    conn = _connect()
     cursor = conn.cursor()
     cursor.execute("""
     INSERT INTO activity (user_id, chat_id, instagram_count, youtube_count, twitter_count, tiktok_count)
@@ -75,6 +104,16 @@ def log_activity(user_id, chat_id, instagram=False, youtube=False, twitter=False
         tiktok_count = tiktok_count + ?
     """, (user_id, chat_id, int(instagram), int(youtube), int(twitter), int(tiktok),
         int(instagram), int(youtube), int(twitter), int(tiktok)))
+    platforms = {"instagram": instagram, "youtube": youtube, "twitter": twitter, "tiktok": tiktok}
+    if media_key and any(platforms.values()):
+        # The same video shared as a reel/p/share link, short link, etc. counts as one media
+        cursor.execute("""
+        INSERT INTO media (media_key, platform, request_count)
+        VALUES (?, ?, 1)
+        ON CONFLICT(media_key) DO UPDATE SET
+            request_count = request_count + 1,
+            last_seen = CURRENT_TIMESTAMP
+        """, (media_key, next(name for name, flag in platforms.items() if flag)))
     conn.commit()
     conn.close()
 
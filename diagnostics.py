@@ -0,0 +1,223 @@
+import asyncio
+import gc
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+# Classes whose live instances are counted in every report (matched by class name, via gc)
+TRACKED_TYPES = ("YoutubeDL", "ClientSession", "Message", "LogRecord")
+
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),  # our own bookkeeping of stage diffs
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def rss_mb() -> float | None:
+    """Current resident set size (Linux), None if unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _short_path(filename: str) -> str:
+    return os.sep.join(filename.split(os.sep)[-2:])
+
+
+def count_live_objects(type_names=TRACKED_TYPES) -> dict[str, int]:
+    counts = dict.fromkeys(type_names, 0)
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        if name in counts:
+            counts[name] += 1
+    return counts
+
+
+class MemoryDiagnostics:
+    """
+    Leak hunting mode: tracemalloc snapshots on a schedule, diffed against the previous one,
+    per pipeline stage net traced memory and top allocation diffs by line, and counts of live
+    heavy objects.
+
+    Stage numbers come from the global traced memory, so concurrent jobs blur them a bit;
+    they're meant to show which stage (and which lines in it) keep growing over hours, not exact
+    per-call sizes. Line diffs need two whole-heap snapshots (seconds on a big heap), so they're
+    taken in a worker thread for 1 of every `stage_sample` calls of a stage, one stage at a time.
+    """
+
+    def __init__(self, interval: float = 600, top: int = 10, nframes: int = 1, stage_sample: int = 20):
+        self.interval = interval
+        self.top = top
+        self.nframes = nframes
+        self.stage_sample = max(1, stage_sample)
+        self.live_counters: dict[str, Callable[[], int]] = {}
+        # Updated from the event loop and worker threads, swapped out by report(): guarded by _lock
+        self._lock = threading.Lock()
+        self._stages: dict[str, list[int]] = {}  # name -> [calls, net bytes, max net bytes, sampled calls]
+        self._stage_lines: dict[str, dict[tuple[str, int], list[int]]] = {}  # name -> line -> [bytes, blocks]
+        self._stage_calls: dict[str, int] = {}  # name -> calls since start, for sampling
+        self._sampling = False  # a sampled stage is in flight
+        self._snapshot: tracemalloc.Snapshot | None = None
+        self._started_at = 0.0
+        self._task: asyncio.Task | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, report_cb: Callable[[str], Awaitable[None]]):
+        if self.enabled:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.nframes)
+        self._snapshot = self._take_snapshot()
+        self._started_at = time.monotonic()
+        with self._lock:
+            self._stages.clear()
+            self._stage_lines.clear()
+        self._stage_calls.clear()
+        self._task = asyncio.create_task(self._run(report_cb))
+        logger.info("Memory diagnostics started")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._snapshot = None
+        with self._lock:
+            self._stages.clear()
+            self._stage_lines.clear()
+        tracemalloc.stop()
+        logger.info("Memory diagnostics stopped")
+
+    @asynccontextmanager
+    async def stage(self, name: str):
+        """Account net traced memory (and sampled line diffs) of a pipeline stage. No-op while diagnostics are off."""
+        if not tracemalloc.is_tracing():
+            yield
+            return
+
+        calls = self._stage_calls.get(name, 0)
+        self._stage_calls[name] = calls + 1
+        before_snapshot = None
+        if calls % self.stage_sample == 0 and not self._sampling:
+            self._sampling = True
+            try:
+                before_snapshot = await asyncio.to_thread(self._take_snapshot)
+            except BaseException:
+                self._sampling = False
+                raise
+
+        # Measured after the snapshot, so its own size isn't counted in the stage
+        before = tracemalloc.get_traced_memory()[0]
+        try:
+            yield
+        finally:
+            delta = tracemalloc.get_traced_memory()[0] - before if tracemalloc.is_tracing() else 0
+            line_diffs = None
+            if before_snapshot is not None:
+                try:
+                    if tracemalloc.is_tracing():
+                        line_diffs = await asyncio.to_thread(self._diff_since, before_snapshot)
+                finally:
+                    self._sampling = False
+            if tracemalloc.is_tracing():
+                self._account(name, delta, line_diffs)
+
+    def _diff_since(self, before: tracemalloc.Snapshot) -> list[tuple[tuple[str, int], int, int]]:
+        """Per-line (line, bytes, blocks) allocation diffs since `before`. Blocking, run it in a worker thread."""
+        diffs = []
+        for stat in self._take_snapshot().compare_to(before, "lineno"):
+            if stat.size_diff or stat.count_diff:
+                frame = stat.traceback[0]
+                diffs.append(((frame.filename, frame.lineno), stat.size_diff, stat.count_diff))
+        return diffs
+
+    def _account(self, name: str, delta: int, line_diffs: list[tuple[tuple[str, int], int, int]] | None):
+        with self._lock:
+            stats = self._stages.setdefault(name, [0, 0, 0, 0])
+            stats[0] += 1
+            stats[1] += delta
+            stats[2] = max(stats[2], delta)
+            if line_diffs is None:
+                return
+            stats[3] += 1
+            lines = self._stage_lines.setdefault(name, {})
+            for line, size_diff, count_diff in line_diffs:
+                totals = lines.setdefault(line, [0, 0])
+                totals[0] += size_diff
+                totals[1] += count_diff
+
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+    def report(self) -> str:
+        """Build a compact text report and start a new comparison window."""
+        lines = []
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        rss = rss_mb()
+        window_min = (time.monotonic() - self._started_at) / 60
+        lines.append(f"RSS: {rss:.1f} MB" if rss is not None else "RSS: n/a")
+        lines.append(f"Traced: {current / (1024 * 1024):.1f} MB (peak {peak / (1024 * 1024):.1f} MB), "
+                     f"window {window_min:.0f} min")
+
+        counts = count_live_objects()
+        for name, counter in self.live_counters.items():
+            try:
+                counts[name] = counter()
+            except Exception as e:
+                logger.warning(f"Live counter {name} failed: {e}")
+        lines.append("Live: " + ", ".join(f"{name}={count}" for name, count in counts.items()))
+
+        # Swap under the lock: stage() keeps accounting from the event loop and worker threads
+        with self._lock:
+            stages, self._stages = self._stages, {}
+            stage_lines, self._stage_lines = self._stage_lines, {}
+        if stages:
+            lines.append("")
+            lines.append(f"Stages (calls, net KB, max KB) with top allocation diffs of sampled calls "
+                         f"(1 of {self.stage_sample}):")
+            for name, (calls, net, max_net, sampled) in sorted(stages.items(), key=lambda item: -item[1][1]):
+                lines.append(f"  {name}: {calls}, {net / 1024:+.0f}, {max_net / 1024:+.0f}, sampled {sampled}")
+                diffs = sorted(stage_lines.get(name, {}).items(), key=lambda item: -abs(item[1][0]))
+                for (filename, lineno), (size_diff, count_diff) in diffs[:self.top]:
+                    lines.append(f"    {_short_path(filename)}:{lineno}: {size_diff / 1024:+.0f} KB "
+                                 f"({count_diff:+d} blocks)")
+
+        if tracemalloc.is_tracing():
+            snapshot = self._take_snapshot()
+            if self._snapshot is not None:
+                lines.append("")
+                lines.append(f"Top {self.top} allocation diffs:")
+                for stat in snapshot.compare_to(self._snapshot, "lineno")[:self.top]:
+                    frame = stat.traceback[0]
+                    lines.append(f"  {_short_path(frame.filename)}:{frame.lineno}: {stat.size_diff / 1024:+.0f} KB "
+                                 f"({stat.count_diff:+d} blocks)")
+            self._snapshot = snapshot
+
+        self._started_at = time.monotonic()
+        return "\n".join(lines)
+
+    async def _run(self, report_cb: Callable[[str], Awaitable[None]]):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                # Snapshot + gc walk take a while on a big heap, keep them off the event loop
+                text = await asyncio.to_thread(self.report)
+                await report_cb(text)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Memory diagnostics report failed: {e}")
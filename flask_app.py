@@ -1,64 +1,143 @@
 import os
-from flask import Flask, render_template
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from flask import Flask, render_template, request
 
 # Absolute path to the database file
 APP_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_FILE = os.path.join(APP_DIR, "bot_usage.db")
+
+# Read-only connections per worker process (match the number of worker threads)
+DB_POOL_SIZE = int(os.getenv("DASHBOARD_DB_POOL_SIZE", "4"))
+DB_POOL_TIMEOUT_SECONDS = 10
+
+STATIC_MAX_AGE_SECONDS = 30 * 24 * 3600  # vendored assets only change with a deploy
+
 app = Flask(__name__)
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = STATIC_MAX_AGE_SECONDS
+
+TOTAL_USERS_QUERY = "SELECT COUNT(*) FROM users"
+TOTAL_CHATS_QUERY = "SELECT COUNT(*) FROM chats"
+TOTAL_CONVERSIONS_QUERY = """
+    SELECT
+        SUM(instagram_count),
+        SUM(youtube_count),
+        SUM(twitter_count),
+        SUM(tiktok_count)
+    FROM activity
+"""
+ACTIVITY_QUERY = """
+    SELECT
+        c.chat_id,
+        c.chat_title,
+        u.user_id,
+        u.username,
+        u.full_name,
+        a.instagram_count,
+        a.youtube_count,
+        a.twitter_count,
+        a.tiktok_count
+    FROM activity a
+    JOIN users u ON a.user_id = u.user_id
+    JOIN chats c ON a.chat_id = c.chat_id
+    ORDER BY c.chat_title, u.username
+"""
+
+
+class ReadOnlyPool:
+    """
+    Pool of read-only SQLite connections (mode=ro, query_only).
+    With the bot's database in WAL mode, readers never block the bot's writes.
+    Queries are constant strings, so each connection's statement cache keeps them prepared.
+    """
+
+    def __init__(self, path: str, size: int):
+        self.uri = Path(path).resolve().as_uri() + "?mode=ro"
+        self.size = size
+        self.pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.uri, uri=True, check_same_thread=False, cached_statements=32)
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                conn = self._idle.get(timeout=DB_POOL_TIMEOUT_SECONDS)
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+
+_pool: ReadOnlyPool | None = None
+
+
+def get_pool() -> ReadOnlyPool:
+    """Connection pool of the current process (created lazily, so each forked worker gets its own)."""
+    global _pool
+    if _pool is None or _pool.pid != os.getpid():
+        _pool = ReadOnlyPool(DB_FILE, DB_POOL_SIZE)
+    return _pool
+
 
 def query_db(query, args=(), one=False):
     """Run a query on the SQLite database."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute(query, args)
-    rows = cursor.fetchall()
-    conn.close()
+    with get_pool().connection() as conn:
+        rows = conn.execute(query, args).fetchall()
     return (rows[0] if rows else None) if one else rows
 
-@app.route("/")
-def index():
-    """Render the main statistics page."""
-    # --- Summary Statistics ---
-    total_users = query_db("SELECT COUNT(*) FROM users", one=True)[0]
-    total_chats = query_db("SELECT COUNT(*) FROM chats", one=True)[0]
-    total_conversions = query_db(
-        """
-        SELECT
-            SUM(instagram_count),
-            SUM(youtube_count),
-            SUM(twitter_count),
-            SUM(tiktok_count)
-        FROM activity
-    """,
-        one=True,
-    )
 
-    conversion_data = {
+def get_conversion_data():
+    total_conversions = query_db(TOTAL_CONVERSIONS_QUERY, one=True)
+    return {
         "instagram": total_conversions[0] or 0,
         "youtube": total_conversions[1] or 0,
         "twitter": total_conversions[2] or 0,
         "tiktok": total_conversions[3] or 0,
     }
 
+
+def cached_response(response, max_age: int):
+    """Add ETag + Cache-Control and answer 304 if the client already has this version."""
+    response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+@app.route("/")
+def index():
+    """Render the main statistics page."""
+    # --- Summary Statistics ---
+    total_users = query_db(TOTAL_USERS_QUERY, one=True)[0]
+    total_chats = query_db(TOTAL_CHATS_QUERY, one=True)[0]
+    conversion_data = get_conversion_data()
+
     # --- Grouped Data ---
-    activity_query = """
-        SELECT
-            c.chat_id,
-            c.chat_title,
-            u.user_id,
-            u.username,
-            u.full_name,
-            a.instagram_count,
-            a.youtube_count,
-            a.twitter_count,
-            a.tiktok_count
-        FROM activity a
-        JOIN users u ON a.user_id = u.user_id
-        JOIN chats c ON a.chat_id = c.chat_id
-        ORDER BY c.chat_title, u.username
-    """
-    activity_data = query_db(activity_query)
+    activity_data = query_db(ACTIVITY_QUERY)
 
     # Process data into a nested structure
     chats_data = {}
@@ -103,7 +182,7 @@ def index():
         reverse=True
     )
 
-    return render_template(
+    html = render_template(
         "index.html",
         total_users=total_users,
         total_chats=total_chats,
@@ -111,6 +190,9 @@ def index():
         private_chats=private_chats,
         group_chats=group_chats,
     )
+    # Always revalidate, but unchanged stats cost the client only a 304
+    return cached_response(app.make_response(html), 0)
 
 if __name__ == "__main__":
-    app.run(debug=True, host='0.0.0.0')
+    # Development server; in production run: gunicorn -c gunicorn.conf.py flask_app:app
+    app.run(debug=os.getenv("FLASK_DEBUG") == "1", host='0.0.0.0')
@@ -0,0 +1,10 @@
+# Production server for the stats dashboard: gunicorn -c gunicorn.conf.py flask_app:app
+import os
+
+bind = os.getenv("DASHBOARD_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("DASHBOARD_WORKERS", "2"))
+worker_class = "gthread"
+# One read-only DB connection per thread, see DASHBOARD_DB_POOL_SIZE in flask_app.py
+threads = int(os.getenv("DASHBOARD_DB_POOL_SIZE", "4"))
+timeout = 30
+accesslog = "-"
@@ -0,0 +1,143 @@
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Fields of the current job (job_id, platform, chat_id, user_id, media, stage), per asyncio task
+_log_context: contextvars.ContextVar[dict] = contextvars.ContextVar("log_context", default={})
+
+CONTEXT_FIELDS = ("job_id", "platform", "chat_id", "user_id", "media", "stage", "duration_ms")
+
+
+@contextmanager
+def job_context(**fields):
+    """Attach fields to every log record emitted inside (including worker threads via asyncio.to_thread)."""
+    fields.setdefault("job_id", _log_context.get().get("job_id") or uuid.uuid4().hex[:8])
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+@contextmanager
+def log_stage(name: str):
+    """Mark records with the pipeline stage and log its duration when it ends."""
+    start = time.perf_counter()
+    failed = False
+    with job_context(stage=name):
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            duration_ms = round((time.perf_counter() - start) * 1000, 1)
+            logger.info(f"Stage {name} {'failed' if failed else 'done'}", extra={"duration_ms": duration_ms})
+
+
+class ContextFilter(logging.Filter):
+    """Copy job context into the record. Must run in the emitting thread/task, i.e. on the QueueHandler."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for field, value in _log_context.get().items():
+            if not hasattr(record, field):
+                setattr(record, field, value)
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Keep 1 of every `rate` DEBUG records per call site; other levels always pass."""
+
+    def __init__(self, rate: int):
+        super().__init__()
+        self.rate = max(1, rate)
+        self._counters: dict[tuple[str, int], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate == 1:
+            return True
+        site = (record.pathname, record.lineno)
+        count = self._counters.get(site, 0)
+        self._counters[site] = count + 1
+        return count % self.rate == 0
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message + job context fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that doesn't fold the traceback into the message (the stock prepare() does),
+    so the listener's formatter still sees it: as exc_text, already formatted in the emitting thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            # A queued traceback would keep every frame (and its locals) alive until the listener runs
+            record.exc_info = None
+        return record
+
+
+def setup_logging(log_file: str = "bot.log", level: str = "INFO", fmt: str = "json",
+                  max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5,
+                  debug_sample_rate: int = 10) -> logging.handlers.QueueListener:
+    """
+    Route all logging through a queue to a background thread, so the event loop never waits
+    for the disk or journald. Returns the started listener; stop() it on shutdown to flush.
+    """
+    if fmt == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+
+    try:
+        import systemd.journal
+        target = systemd.journal.JournalHandler()
+    except ImportError:
+        target = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+        )
+    target.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = StructuredQueueHandler(log_queue)
+    queue_handler.addFilter(DebugSamplingFilter(debug_sample_rate))
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.setLevel(level.upper())
+    root.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(log_queue, target, respect_handler_level=True)
+    listener.start()
+    return listener
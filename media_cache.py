@@ -0,0 +1,199 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+EVICTION_POLICIES = ("lru", "lfu")
+
+
+@dataclass
+class CachedMedia:
+    key: str
+    fmt: str
+    path: str
+    size: int  # video bytes; the cache budget also counts thumb_size
+    duration: float | None = None
+    width: int | None = None
+    height: int | None = None
+    thumbnail: str | None = None
+    thumb_size: int = 0
+    hits: int = 0
+    last_access: float = 0.0
+
+
+class MediaCache:
+    """
+    Content-addressed on-disk cache of final (post-processed) videos.
+
+    Entry = `<root>/<xx>/<sha1(key|fmt)>.mp4` + `.json` sidecar with metadata (+ `.jpg` thumbnail).
+    Files are written to a temp name and renamed into place, so a reader never sees a partial file,
+    and never modified afterwards: it's safe to pass the path to an uploader or mmap it.
+    Total size (videos + thumbnails) is bounded by `max_bytes`, evicting by least recent (lru)
+    or least frequent (lfu) use. Entries handed out by acquire() are not evicted until release().
+    """
+
+    def __init__(self, root: str, max_bytes: int, policy: str = "lru"):
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy: {policy}")
+        self.root = Path(root).resolve()
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self._entries: dict[str, CachedMedia] = {}
+        self._pins: dict[str, int] = {}  # digest -> acquired and not yet released
+        self._lock = threading.Lock()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def _digest(key: str, fmt: str) -> str:
+        return hashlib.sha1(f"{key}|{fmt}".encode("utf-8")).hexdigest()
+
+    def _paths(self, digest: str) -> tuple[Path, Path, Path]:
+        base = self.root / digest[:2] / digest
+        return base.with_suffix(".mp4"), base.with_suffix(".json"), base.with_suffix(".jpg")
+
+    def _load(self):
+        for meta_path in self.root.glob("*/*.json"):
+            try:
+                entry = CachedMedia(**json.loads(meta_path.read_text(encoding="utf-8")))
+            except Exception as e:
+                logger.warning(f"Dropping broken cache entry {meta_path}: {e}")
+                meta_path.unlink(missing_ok=True)
+                continue
+            if not os.path.exists(entry.path):
+                meta_path.unlink(missing_ok=True)
+                continue
+            self._entries[meta_path.stem] = entry
+
+        # Leftovers of interrupted writes: temp files, and files renamed into place whose
+        # .json sidecar was never written (put() writes it last), or whose sidecar was dropped above
+        for path in self.root.glob("*/*"):
+            if path.suffix == ".tmp" or (path.suffix in (".mp4", ".jpg") and path.stem not in self._entries):
+                logger.info(f"Removing orphaned cache file {path}")
+                path.unlink(missing_ok=True)
+
+        logger.info(f"Media cache: {len(self._entries)} entries, {self.total_bytes() / (1024 * 1024):.1f} MB")
+
+    @staticmethod
+    def _write_meta(meta_path: Path, entry: CachedMedia):
+        tmp_path = meta_path.with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps(asdict(entry)), encoding="utf-8")
+        os.replace(tmp_path, meta_path)
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(entry.size + entry.thumb_size for entry in self._entries.values())
+
+    def acquire(self, key: str, fmt: str) -> CachedMedia | None:
+        """
+        Return the cached entry (and count the hit) or None. The entry is pinned: its files
+        stay on disk until release(), however long the upload takes to open them.
+        """
+        digest = self._digest(key, fmt)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            if not os.path.exists(entry.path):
+                del self._entries[digest]
+                return None
+            entry.hits += 1
+            entry.last_access = time.time()
+            self._pins[digest] = self._pins.get(digest, 0) + 1
+
+        try:
+            self._write_meta(self._paths(digest)[1], entry)
+        except OSError as e:
+            logger.warning(f"Failed to update cache metadata for {key}: {e}")
+        return entry
+
+    def release(self, entry: CachedMedia):
+        """Unpin an entry returned by acquire(). Eviction happens on the next put()."""
+        digest = self._digest(entry.key, entry.fmt)
+        with self._lock:
+            pins = self._pins.get(digest, 0) - 1
+            if pins > 0:
+                self._pins[digest] = pins
+            else:
+                self._pins.pop(digest, None)
+
+    def put(self, key: str, fmt: str, src_path: str, *, duration: float | None = None,
+            width: int | None = None, height: int | None = None, thumbnail: str | None = None,
+            move: bool = True) -> CachedMedia | None:
+        """
+        Store a finished file (and its thumbnail). With `move=True` the source files are moved
+        into the cache (a rename when it's on the same filesystem), otherwise copied.
+        """
+        size = os.path.getsize(src_path)
+        if size > self.max_bytes:
+            return None
+
+        digest = self._digest(key, fmt)
+        video_path, meta_path, thumb_path = self._paths(digest)
+        video_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._store_file(src_path, video_path, move)
+        if thumbnail and os.path.exists(thumbnail):
+            self._store_file(thumbnail, thumb_path, move)
+        else:
+            thumb_path.unlink(missing_ok=True)
+
+        thumb_size = thumb_path.stat().st_size if thumb_path.exists() else 0
+        entry = CachedMedia(
+            key=key, fmt=fmt, path=str(video_path), size=size,
+            duration=duration, width=width, height=height,
+            thumbnail=str(thumb_path) if thumb_size else None, thumb_size=thumb_size, last_access=time.time(),
+        )
+        self._write_meta(meta_path, entry)
+
+        with self._lock:
+            self._entries[digest] = entry
+            victims = self._pick_victims(keep=digest)
+        for victim in victims:
+            self._remove(victim)
+        return entry
+
+    @staticmethod
+    def _store_file(src_path: str, dest: Path, move: bool):
+        tmp_path = dest.with_suffix(dest.suffix + ".tmp")
+        if move:
+            shutil.move(src_path, tmp_path)
+        else:
+            shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, dest)
+
+    def _pick_victims(self, keep: str) -> list[str]:
+        """Choose entries to evict until the cache fits the budget, skipping pinned ones. Caller holds the lock."""
+        total = sum(entry.size + entry.thumb_size for entry in self._entries.values())
+        if total <= self.max_bytes:
+            return []
+
+        if self.policy == "lfu":
+            order = lambda item: (item[1].hits, item[1].last_access)
+        else:
+            order = lambda item: item[1].last_access
+
+        victims = []
+        for digest, entry in sorted(self._entries.items(), key=order):
+            if total <= self.max_bytes:
+                break
+            if digest == keep or digest in self._pins:
+                continue
+            victims.append(digest)
+            total -= entry.size + entry.thumb_size
+        for digest in victims:
+            del self._entries[digest]
+        return victims
+
+    def _remove(self, digest: str):
+        video_path, meta_path, thumb_path = self._paths(digest)
+        meta_path.unlink(missing_ok=True)
+        thumb_path.unlink(missing_ok=True)
+        video_path.unlink(missing_ok=True)
@@ -0,0 +1,178 @@
+import logging
+import re
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, urljoin, urlsplit
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+HOST_ALIASES = {
+    "x.com": "twitter.com",
+    "mobile.twitter.com": "twitter.com",
+    "mobile.x.com": "twitter.com",
+    "m.youtube.com": "youtube.com",
+    "youtu.be": "youtube.com",
+    "m.tiktok.com": "tiktok.com",
+    "instagr.am": "instagram.com",
+}
+
+TIKTOK_SHORT_HOSTS = ("vm.tiktok.com", "vt.tiktok.com")
+
+_SAFE_ID_RE = re.compile(r"[^\w-]")
+
+
+class TTLCache:
+    """Small LRU cache with per-entry time to live. Not thread-safe: use from the event loop."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    def get(self, key: str) -> str | None:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def _split(url: str) -> tuple[str, list[str], dict]:
+    """Return (canonical host, path segments, query) for a URL."""
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if host not in TIKTOK_SHORT_HOSTS:
+        host = HOST_ALIASES.get(host, host)
+    segments = [s for s in parts.path.split("/") if s]
+    return host, segments, parse_qs(parts.query)
+
+
+def media_key(url: str) -> str | None:
+    """
+    Canonical media key `platform:id` for a link, independent of tracking params,
+    host aliases (x.com/twitter.com, www., m.) and trailing slashes.
+
+    TikTok short links can't be mapped without a network call: they get a
+    `tiktok:short-<code>` key, see resolve_short_link().
+    """
+    raw_host = (urlsplit(url.strip()).hostname or "").lower()
+    host, segments, query = _split(url)
+
+    if host == "instagram.com" and len(segments) >= 2:
+        # reel/<id>, reels/<id>, p/<id> and tv/<id> are the same media; share/ and stories/ are not
+        if segments[0] in ("reel", "reels", "p", "tv"):
+            return f"instagram:{segments[1]}"
+        return f"instagram:{segments[0]}-{'-'.join(segments[1:3])}"
+
+    if host == "youtube.com":
+        if raw_host == "youtu.be" and segments:
+            return f"youtube:{segments[0]}"
+        if len(segments) >= 2 and segments[0] in ("shorts", "embed", "live"):
+            return f"youtube:{segments[1]}"
+        if query.get("v"):
+            return f"youtube:{query['v'][0]}"
+
+    if host == "twitter.com" and "status" in segments:
+        idx = segments.index("status")
+        if idx + 1 < len(segments):
+            return f"twitter:{segments[idx + 1]}"
+
+    if host in TIKTOK_SHORT_HOSTS and segments:
+        return f"tiktok:short-{segments[0]}"
+
+    if host == "tiktok.com":
+        if "video" in segments:
+            idx = segments.index("video")
+            if idx + 1 < len(segments):
+                return f"tiktok:{segments[idx + 1]}"
+        if len(segments) >= 2 and segments[0] == "t":
+            return f"tiktok:short-{segments[1]}"
+
+    return None
+
+
+def key_filename(key: str) -> str:
+    """Media key as a safe file name stem: `youtube:abc` -> `youtube_abc`."""
+    platform, _, media_id = key.partition(":")
+    return f"{platform}_{_SAFE_ID_RE.sub('_', media_id)}"
+
+
+def is_short_link(url: str) -> bool:
+    key = media_key(url)
+    return bool(key) and key.startswith("tiktok:short-")
+
+
+_redirect_cache = TTLCache()
+
+
+def configure_redirect_cache(maxsize: int, ttl: float):
+    global _redirect_cache
+    _redirect_cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+
+async def resolve_short_link(url: str, session: aiohttp.ClientSession | None = None,
+                             timeout_s: float = 10, max_hops: int = 5) -> str:
+    """
+    Follow redirects of a short link (vm.tiktok.com/..., tiktok.com/t/...) to the full URL.
+    Results are cached (LRU + TTL); on any error the original URL is returned.
+    """
+    if not is_short_link(url):
+        return url
+
+    short_key = media_key(url)
+    cached = _redirect_cache.get(short_key)
+    if cached:
+        return cached
+
+    own_session = session is None
+    if own_session:
+        session = aiohttp.ClientSession()
+
+    resolved = url
+    try:
+        timeout = aiohttp.ClientTimeout(total=timeout_s)
+        current = url
+        for _ in range(max_hops):
+            # HEAD without following redirects: only the Location header is needed, not the page
+            async with session.head(current, allow_redirects=False, timeout=timeout) as resp:
+                location = resp.headers.get("Location")
+            if not location:
+                break
+            current = urljoin(current, location)
+            if not is_short_link(current) and media_key(current):
+                resolved = current
+                break
+    except Exception as e:
+        logger.warning(f"Failed to resolve short link {url}: {e}")
+        return url
+    finally:
+        if own_session:
+            await session.close()
+
+    if resolved != url:
+        _redirect_cache.set(short_key, resolved)
+    return resolved
+
+
+async def resolve_media_key(url: str, session: aiohttp.ClientSession | None = None) -> str | None:
+    """media_key() that resolves short links first."""
+    if is_short_link(url):
+        url = await resolve_short_link(url, session)
+    return media_key(url)
@@ -0,0 +1,74 @@
+"""
+Check that in local Bot API mode videos are sent as file:// paths, not uploaded.
+
+Starts a stub Bot API server, points the bot at it with TELEGRAM_API_LOCAL=1 and sends a
+small file the way the download handlers do. Run from the repository root:
+
+    python scripts/check_local_api_upload.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+TOKEN = "123456:stub"
+requests = []
+
+
+async def send_video(request: web.Request) -> web.Response:
+    requests.append(await request.post())
+    return web.json_response({
+        "ok": True,
+        "result": {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}},
+    })
+
+
+async def main():
+    app = web.Application()
+    app.router.add_post(f"/bot{TOKEN}/sendVideo", send_video)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    # Settings are read when the bot module is imported
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": TOKEN,
+        "TELEGRAM_API_BASE": f"http://127.0.0.1:{port}",
+        "TELEGRAM_API_LOCAL": "1",
+    })
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    import telegram_video
+
+    settings = telegram_video.settings
+    session = AiohttpSession(api=TelegramAPIServer.from_base(settings.telegram_api_base, is_local=True))
+    bot = Bot(token=settings.bot_token, session=session)
+
+    with tempfile.NamedTemporaryFile(suffix=".mp4") as video:
+        video.write(b"\0" * 1024)
+        video.flush()
+        try:
+            await bot.send_video(1, telegram_video._video_input(video.name), caption="stub")
+        finally:
+            await bot.session.close()
+            await runner.cleanup()
+
+        assert len(requests) == 1, f"expected one sendVideo request, got {len(requests)}"
+        field = requests[0].get("video")
+        expected = Path(video.name).resolve().as_uri()
+        assert isinstance(field, str), f"video was uploaded as a file: {field!r}"
+        assert field == expected, f"video={field!r}, expected {expected!r}"
+
+    print(f"OK: video={field} sent as a plain form field")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
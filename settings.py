@@ -0,0 +1,118 @@
+import os
+import tempfile
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+
+
+def _env_int(name: str) -> int | None:
+    value = os.getenv(name, "").strip()
+    return int(value) if value else None
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Bot configuration, parsed once from the environment (.env included)."""
+    bot_token: str | None
+    admin_id: int | None
+    admin_chat_id: int | None
+
+    # Self-hosted telegram-bot-api server (empty = api.telegram.org)
+    telegram_api_base: str
+    telegram_api_local: bool  # server runs with --local and shares our filesystem
+    upload_limit_mb: float
+
+    # Instagram via yt-dlp + cookiefile (може бути JSON export -> конвертуємо)
+    ig_ytdlp_cookies: str
+    ig_rate_seconds: float
+    cookies_cache_dir: str
+
+    # TikTok via Cobalt
+    cobalt_api_url: str  # напр. http://192.168.2.204:9000/
+    cobalt_timeout_seconds: float
+    cobalt_always_proxy: bool
+    cobalt_video_quality: str
+
+    # ffmpeg/ffprobe (looked up in PATH if these don't exist)
+    ffmpeg_path: str
+    ffprobe_path: str
+
+    # Pool of reusable yt_dlp.YoutubeDL instances
+    ytdl_pool_size: int
+    ytdl_pool_max_uses: int
+    ytdl_pool_max_age_seconds: float
+
+    # Short link (vm.tiktok.com/...) redirect cache
+    short_link_cache_size: int
+    short_link_cache_ttl_seconds: float
+
+    # On-disk cache of final videos (disabled when media_cache_dir is empty)
+    media_cache_dir: str
+    media_cache_max_bytes: int
+    media_cache_policy: str  # lru | lfu
+
+    # Logging (journald if available, otherwise a rotating log_file)
+    log_file: str
+    log_level: str
+    log_format: str  # json | text
+    log_max_bytes: int
+    log_backup_count: int
+    log_debug_sample_rate: int  # keep 1 of N debug lines per call site
+
+    # Memory diagnostics (tracemalloc), can also be toggled with /diag
+    diagnostics_enabled: bool
+    diagnostics_interval_seconds: float
+    diagnostics_top: int
+    diagnostics_stage_sample: int  # per-stage allocation diffs for 1 of N calls
+
+    # Link throttling: default per-user/per-chat quotas, overridden by a hot-reloaded JSON policy file
+    throttle_policy_file: str
+    throttle_user_limit: int
+    throttle_chat_limit: int
+    throttle_window_seconds: float
+
+
+def load_settings() -> Settings:
+    """Load environment variables and build the Settings object."""
+    load_dotenv()
+    telegram_api_base = os.getenv("TELEGRAM_API_BASE", "").rstrip("/")
+    telegram_api_local = bool(telegram_api_base) and os.getenv("TELEGRAM_API_LOCAL", "0") == "1"
+    return Settings(
+        bot_token=os.getenv("TELEGRAM_BOT_TOKEN"),
+        admin_id=_env_int("TELEGRAM_ADMIN_ID"),
+        admin_chat_id=_env_int("TELEGRAM_ADMIN_CHAT_ID"),
+        telegram_api_base=telegram_api_base,
+        telegram_api_local=telegram_api_local,
+        upload_limit_mb=float(os.getenv("TELEGRAM_UPLOAD_LIMIT_MB") or (2000 if telegram_api_local else 50)),
+        ig_ytdlp_cookies=os.getenv("IG_YTDLP_COOKIES", ""),
+        ig_rate_seconds=float(os.getenv("IG_RATE_SECONDS", "0")),
+        cookies_cache_dir=os.getenv("COOKIES_CACHE_DIR", os.path.join(tempfile.gettempdir(), "bot_cookies")),
+        cobalt_api_url=os.getenv("COBALT_API_URL", ""),
+        cobalt_timeout_seconds=float(os.getenv("COBALT_TIMEOUT_SECONDS", "120")),
+        cobalt_always_proxy=os.getenv("COBALT_ALWAYS_PROXY", "1") == "1",
+        cobalt_video_quality=os.getenv("COBALT_VIDEO_QUALITY", "max"),
+        ffmpeg_path=os.getenv("FFMPEG_PATH", "/usr/bin/ffmpeg"),
+        ffprobe_path=os.getenv("FFPROBE_PATH", "/usr/bin/ffprobe"),
+        ytdl_pool_size=int(os.getenv("YTDL_POOL_SIZE", "2")),
+        ytdl_pool_max_uses=int(os.getenv("YTDL_POOL_MAX_USES", "50")),
+        ytdl_pool_max_age_seconds=float(os.getenv("YTDL_POOL_MAX_AGE_SECONDS", "1800")),
+        short_link_cache_size=int(os.getenv("SHORT_LINK_CACHE_SIZE", "4096")),
+        short_link_cache_ttl_seconds=float(os.getenv("SHORT_LINK_CACHE_TTL_SECONDS", "86400")),
+        media_cache_dir=os.getenv("MEDIA_CACHE_DIR", ""),
+        media_cache_max_bytes=int(float(os.getenv("MEDIA_CACHE_MAX_MB", "2048")) * 1024 * 1024),
+        media_cache_policy=os.getenv("MEDIA_CACHE_POLICY", "lru").lower(),
+        log_file=os.getenv("LOG_FILE", "bot.log"),
+        log_level=os.getenv("LOG_LEVEL", "INFO"),
+        log_format=os.getenv("LOG_FORMAT", "json").lower(),
+        log_max_bytes=int(float(os.getenv("LOG_MAX_MB", "10")) * 1024 * 1024),
+        log_backup_count=int(os.getenv("LOG_BACKUP_COUNT", "5")),
+        log_debug_sample_rate=int(os.getenv("LOG_DEBUG_SAMPLE_RATE", "10")),
+        diagnostics_enabled=os.getenv("DIAGNOSTICS", "0") == "1",
+        diagnostics_interval_seconds=float(os.getenv("DIAGNOSTICS_INTERVAL_SECONDS", "3600")),
+        diagnostics_top=int(os.getenv("DIAGNOSTICS_TOP", "10")),
+        diagnostics_stage_sample=int(os.getenv("DIAGNOSTICS_STAGE_SAMPLE", "20")),
+        throttle_policy_file=os.getenv("THROTTLE_POLICY_FILE", ""),
+        throttle_user_limit=int(os.getenv("THROTTLE_USER_LIMIT", "10")),
+        throttle_chat_limit=int(os.getenv("THROTTLE_CHAT_LIMIT", "30")),
+        throttle_window_seconds=float(os.getenv("THROTTLE_WINDOW_SECONDS", "60")),
+    )
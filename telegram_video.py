@@ -1,45 +1,51 @@
+import argparse
 import asyncio
+import importlib
 import os
 import re
 import shutil
 import logging
 import json
+import subprocess
+import sys
 import tempfile
 import hashlib
+from contextlib import asynccontextmanager
 from pathlib import Path
 import aiohttp
 
-from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher, Router, types, F
 from aiogram.types import LinkPreviewOptions
 from aiogram.types.input_file import FSInputFile
-import yt_dlp
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 
 from db_utils import log_user_start, log_chat_usage, log_activity
-
-# Load environment variables
-load_dotenv()
+from diagnostics import MemoryDiagnostics
+from log_utils import job_context, log_stage, setup_logging
+from media_cache import MediaCache
+from media_keys import configure_redirect_cache, key_filename, media_key, resolve_media_key
+from video_post import VideoMeta, find_tool, prepare_video, thumbnail_path
+from settings import load_settings
+from throttling import Policy, PolicyStore, Rule, ThrottlingMiddleware
+from ytdl_pool import YoutubeDLPool
+
+# Configuration (parsed once)
+settings = load_settings()
 
 # Constants
-BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-ADMIN_ID = os.getenv("TELEGRAM_ADMIN_ID")
-ADMIN_CHAT_ID = os.getenv("TELEGRAM_ADMIN_CHAT_ID")
 INSTAGRAM_REELS_REGEX = r"https?://(?:www\.)?instagram\.com/(?:reel|p|share|stories)/[\w-]+(/?)(?:\?.*)?$"
 YOUTUBE_SHORTS_REGEX = r"https?://(?:www\.)?youtube\.com/shorts/[\w-]+"
 TWITTER_REGEX = r"https?://(?:www\.)?(?:twitter\.com|x\.com)/[\w-]+/status/[\d]+"
 TIKTOK_REGEX = r"https?://(?:www\.|vm\.)?tiktok\.com/(?:@[\w.-]+/video/\d+|[\w]+/?)"
 
 IGNORED_CHATS_FOR_TIKTOK = (-1, -2)
-# Instagram via yt-dlp + cookiefile (може бути JSON export -> конвертуємо)
-IG_YTDLP_COOKIES = os.getenv("IG_YTDLP_COOKIES", "")
-IG_RATE_SECONDS = float(os.getenv("IG_RATE_SECONDS", "0"))
-COOKIES_CACHE_DIR = os.getenv("COOKIES_CACHE_DIR", os.path.join(tempfile.gettempdir(), "bot_cookies"))
 
-# TikTok via Cobalt
-COBALT_API_URL = os.getenv("COBALT_API_URL", "")  # напр. http://192.168.2.204:9000/
-COBALT_TIMEOUT_SECONDS = float(os.getenv("COBALT_TIMEOUT_SECONDS", "120"))
-COBALT_ALWAYS_PROXY = os.getenv("COBALT_ALWAYS_PROXY", "1") == "1"
-COBALT_VIDEO_QUALITY = os.getenv("COBALT_VIDEO_QUALITY", "max")
+FFMPEG = find_tool("ffmpeg", settings.ffmpeg_path)
+FFPROBE = find_tool("ffprobe", settings.ffprobe_path)
+
+# Heavy modules that are imported on first use (or preloaded in background once polling started)
+HEAVY_MODULES = ("yt_dlp",)
 
 START_MESSAGE_NON_ADMIN = (
     "🖖 Привіт, мене звати Кортес.\n\n"
@@ -54,28 +60,140 @@ START_MESSAGE_NON_ADMIN = (
     "Слідкуй за оновленнями та за іншими розробками на [каналі автора](https://t.me/knemchenko_log). Ви також можете [підтримати проект фінансово](https://send.monobank.ua/jar/3ekUcZV1iR), але робіть це після того як задонатие на ЗСУ."
 )
 
-# Configure logging
-try:
-    import systemd.journal
-    journal_handler = systemd.journal.JournalHandler()
-    journal_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-    logging.getLogger().addHandler(journal_handler)
-    logging.getLogger().setLevel(logging.INFO)
-except ImportError:
-    logging.basicConfig(
-        filename='bot.log',
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s'
-    )
-
 logger = logging.getLogger(__name__)
 
-# Initialize bot and dispatcher
-bot = Bot(token=BOT_TOKEN)
+# Warm, reusable yt_dlp.YoutubeDL instances (checked out per job from executor threads)
+ydl_pool = YoutubeDLPool(
+    max_idle_per_key=settings.ytdl_pool_size,
+    max_uses=settings.ytdl_pool_max_uses,
+    max_age=settings.ytdl_pool_max_age_seconds,
+)
+
+configure_redirect_cache(settings.short_link_cache_size, settings.short_link_cache_ttl_seconds)
+
+# Media jobs in progress: (chat_id, media key), and per-key locks with their user count
+_inflight_jobs: set[tuple[int, str]] = set()
+_media_locks: dict[str, list] = {}
+
+# Memory diagnostics (DIAGNOSTICS=1 or /diag on)
+diagnostics = MemoryDiagnostics(
+    interval=settings.diagnostics_interval_seconds,
+    top=settings.diagnostics_top,
+    stage_sample=settings.diagnostics_stage_sample,
+)
+diagnostics.live_counters["YoutubeDL(pool)"] = ydl_pool.live_count
+
+# Optional on-disk cache of final videos, opened in main() when MEDIA_CACHE_DIR is set
+media_cache: MediaCache | None = None
+
+# Bot is created in main(); dispatcher and router are cheap and needed for handler registration
+bot: Bot | None = None
 router = Router()
 dp = Dispatcher()
 dp.include_router(router)
 
+# Link platforms in handler order: the first matching handler takes the message
+LINK_PLATFORMS = (
+    ("instagram", INSTAGRAM_REELS_REGEX),
+    ("youtube", YOUTUBE_SHORTS_REGEX),
+    ("twitter", TWITTER_REGEX),
+    ("tiktok", TIKTOK_REGEX),
+)
+
+
+def link_platform(message: types.Message) -> str | None:
+    """Platform of a message that would start a download (a single link), otherwise None."""
+    if not message.text or len(message.text.split(' ')) != 1:
+        return None
+    for platform, regex in LINK_PLATFORMS:
+        if re.search(regex, message.text):
+            return platform
+    return None
+
+
+# Quotas checked before link handlers; THROTTLE_POLICY_FILE (if set) overrides the defaults
+throttle_policy = PolicyStore(
+    settings.throttle_policy_file,
+    default=Policy(
+        rules=[
+            Rule("user", settings.throttle_user_limit, settings.throttle_window_seconds),
+            Rule("chat", settings.throttle_chat_limit, settings.throttle_window_seconds),
+        ],
+        blocked={chat_id: frozenset({"tiktok"}) for chat_id in IGNORED_CHATS_FOR_TIKTOK},
+    ),
+)
+router.message.outer_middleware(ThrottlingMiddleware(
+    throttle_policy, link_platform,
+    exempt_users=frozenset({settings.admin_id}) if settings.admin_id else frozenset(),
+))
+
+
+def _load_yt_dlp():
+    """Import yt_dlp on first use (it is large: hundreds of extractor modules)."""
+    return importlib.import_module("yt_dlp")
+
+
+def _preload_heavy_modules():
+    """Import heavy modules so the first download does not pay for it. Runs in a worker thread."""
+    for name in HEAVY_MODULES:
+        try:
+            importlib.import_module(name)
+            logger.info(f"Preloaded module: {name}")
+        except Exception as e:
+            logger.warning(f"Failed to preload module {name}: {e}")
+    _warm_ydl_pool()
+
+
+async def _on_startup():
+    # Not awaited on purpose: polling starts while yt_dlp is being imported in background
+    asyncio.get_running_loop().run_in_executor(None, _preload_heavy_modules)
+
+
+def profile_startup(top: int = 25):
+    """Print an import-time breakdown of the bot module and its heavy dependencies."""
+    # Plain import statements: -X importtime only reports the module itself (with its cumulative
+    # time) for `import x`, and the pool warm-up of _preload_heavy_modules() would pollute stderr
+    code = "import telegram_video; " + "; ".join(f"import {name}" for name in HEAVY_MODULES)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue  # header line
+        rows.append((cumulative_us, self_us, parts[2].rstrip()))
+
+    if proc.returncode != 0 or not rows:
+        print(proc.stderr, file=sys.stderr)
+        return
+
+    top_level = {}
+    for cumulative_us, _, name in rows:
+        # Top-level imports have exactly one leading space after "|"
+        if not name.startswith("  "):
+            top_level[name.strip()] = cumulative_us
+
+    print(f"{'cumulative ms':>14} {'self ms':>10}  module")
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>10.1f}  {name.strip()}")
+
+    print()
+    print("Top-level imports:")
+    for name, cumulative_us in sorted(top_level.items(), key=lambda item: item[1], reverse=True):
+        print(f"{cumulative_us / 1000:>14.1f}  {name}")
+    print(f"{'total':>14}: {sum(top_level.values()) / 1000:.1f} ms")
+
 
 def extract_shortcode(url: str) -> str:
     """Extract shortcode from Instagram Reel URL."""
@@ -86,6 +204,141 @@ def locate_video_file(directory: str) -> str:
     return next((file for file in os.listdir(directory) if file.endswith(".mp4")), None)
 
 
+def _video_input(path: str) -> FSInputFile | str:
+    """
+    File to pass to send_video. A local Bot API server sharing our filesystem reads the file
+    itself from a file:// URI, so the video isn't streamed through this process as multipart.
+    """
+    if settings.telegram_api_local:
+        return Path(path).resolve().as_uri()
+    return FSInputFile(path)
+
+
+def _temp_stem(url: str, key: str | None = None) -> str:
+    """Temp file name stem from the canonical media key, so URL variants share one name."""
+    key = key or media_key(url)
+    return key_filename(key) if key else hashlib.sha1(url.encode("utf-8")).hexdigest()[:12]
+
+
+@asynccontextmanager
+async def media_job(chat_id: int, key: str):
+    """
+    Deduplicate work by canonical media key.
+    Yields False if the same media is already being processed for this chat.
+    Jobs for the same media in different chats run one after another (they share temp files).
+    """
+    if (chat_id, key) in _inflight_jobs:
+        yield False
+        return
+
+    _inflight_jobs.add((chat_id, key))
+    entry = _media_locks.setdefault(key, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield True
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _media_locks[key]
+        _inflight_jobs.discard((chat_id, key))
+
+
+@asynccontextmanager
+async def _stage(name: str):
+    """Pipeline stage: timed in the structured log, memory-accounted in diagnostics mode."""
+    # Diagnostics outside: its sampled snapshots shouldn't count in the logged stage duration
+    async with diagnostics.stage(name):
+        with log_stage(name):
+            yield
+
+
+def _open_media_cache() -> MediaCache | None:
+    if not settings.media_cache_dir:
+        return None
+    return MediaCache(settings.media_cache_dir, settings.media_cache_max_bytes, settings.media_cache_policy)
+
+
+def _video_meta(info: dict | None) -> VideoMeta:
+    """duration/width/height from a yt-dlp info dict (fallback when ffprobe is unavailable)."""
+    info = info or {}
+    return VideoMeta(
+        duration=float(info["duration"]) if info.get("duration") else None,
+        width=int(info["width"]) if info.get("width") else None,
+        height=int(info["height"]) if info.get("height") else None,
+    )
+
+
+async def _prepare_video(video_file: str, info: dict | None = None) -> VideoMeta:
+    """Probe the file once, remux with +faststart if needed and extract a thumbnail."""
+    async with _stage("postprocess"):
+        meta = await asyncio.to_thread(prepare_video, video_file, FFMPEG, FFPROBE)
+    return meta or _video_meta(info)
+
+
+def _send_video_kwargs(meta: VideoMeta | None) -> dict:
+    """Extra send_video arguments, so clients can show and start playing the video right away."""
+    kwargs = {"supports_streaming": True}
+    if meta is None:
+        return kwargs
+    if meta.duration:
+        kwargs["duration"] = round(meta.duration)
+    if meta.width and meta.height:
+        kwargs["width"] = meta.width
+        kwargs["height"] = meta.height
+    if meta.thumbnail and os.path.exists(meta.thumbnail):
+        kwargs["thumbnail"] = FSInputFile(meta.thumbnail)
+    return kwargs
+
+
+async def _send_cached_video(key: str | None, fmt: str, chat_id: int, caption: str) -> bool:
+    """Send the video from the media cache. Returns False on cache miss (or when the cache is off)."""
+    if media_cache is None or not key:
+        return False
+
+    async with _stage("cache.get"):
+        entry = await asyncio.to_thread(media_cache.acquire, key, fmt)
+    if entry is None:
+        return False
+
+    try:
+        size_mb = entry.size / (1024 * 1024)
+        if size_mb > settings.upload_limit_mb:
+            # Cached under a higher limit (local Bot API server), can't be sent through this one
+            logger.info(f"Skipping cached {key} ({fmt}): {size_mb:.2f} MB exceeds the {settings.upload_limit_mb:.0f} MB limit")
+            return False
+        logger.info(f"Media cache hit for {key} ({fmt}), hits: {entry.hits}")
+        meta = VideoMeta(duration=entry.duration, width=entry.width, height=entry.height, thumbnail=entry.thumbnail)
+        await bot.send_video(chat_id, _video_input(entry.path), caption=caption, parse_mode="Markdown",
+                             **_send_video_kwargs(meta))
+    finally:
+        # Uploads (and the local Bot API server) open the files lazily, keep them pinned until sent
+        media_cache.release(entry)
+    return True
+
+
+async def _release_video(video_file: str, key: str | None, fmt: str, meta: VideoMeta | None = None):
+    """Move a sent video (with its probe results) into the media cache, or just delete it when the cache is off."""
+    meta = meta or VideoMeta()
+    if media_cache is not None and key:
+        try:
+            async with _stage("cache.put"):
+                await asyncio.to_thread(
+                    media_cache.put, key, fmt, video_file,
+                    duration=meta.duration, width=meta.width, height=meta.height, thumbnail=meta.thumbnail,
+                )
+        except Exception as e:
+            logger.warning(f"Failed to store {key} in media cache: {e}")
+    _discard_video(video_file)
+
+
+def _discard_video(video_file: str):
+    """Remove a temp video and its thumbnail if they're still there. Call it in `finally` of every download."""
+    for path in (video_file, thumbnail_path(video_file)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
 def _ensure_cookiefile_for_ytdlp(cookies_file: str, *, prefix: str = "ig") -> str:
     """
     yt-dlp очікує Netscape cookies.txt.
@@ -109,7 +362,7 @@ def _ensure_cookiefile_for_ytdlp(cookies_file: str, *, prefix: str = "ig") -> st
         raw = p.read_text(encoding="utf-8", errors="ignore")
         digest = hashlib.sha1(raw.encode("utf-8", errors="ignore")).hexdigest()
 
-        out_dir = Path(COOKIES_CACHE_DIR)
+        out_dir = Path(settings.cookies_cache_dir)
         out_dir.mkdir(parents=True, exist_ok=True)
         out_path = out_dir / f"{prefix}_cookies_{digest}.txt"
         if out_path.exists():
@@ -244,76 +497,133 @@ async def notify_admin(url: str = None, error: Exception = None, sender: types.U
 
     # Send the message to admin
     try:
-        await bot.send_message(ADMIN_ID, message, parse_mode="Markdown")
+        await bot.send_message(settings.admin_id, message, parse_mode="Markdown")
     except Exception as e:
         # If sending fails with Markdown, try without markup
         logger.error(f"Failed to send admin notification with Markdown: {e}")
         plain_message = message.replace('*', '').replace('`', '').replace('[', '').replace(']', '')
         try:
-            await bot.send_message(ADMIN_ID, plain_message)
+            await bot.send_message(settings.admin_id, plain_message)
         except Exception as e2:
             logger.error(f"Failed to send plain text notification: {e2}")
 
 
 
 async def _ig_rate_limit():
-    if IG_RATE_SECONDS > 0:
-        await asyncio.sleep(IG_RATE_SECONDS)
+    if settings.ig_rate_seconds > 0:
+        await asyncio.sleep(settings.ig_rate_seconds)
+
+def _instagram_ydl_opts() -> dict:
+    ydl_opts = {
+        "format": "mp4[height<=720]/best[ext=mp4]/best",
+        "outtmpl": os.path.join(tempfile.gettempdir(), "instagram_%(id)s.%(ext)s"),
+        "merge_output_format": "mp4",
+        "quiet": True,
+        "no_warnings": True,
+        "retries": 2,
+        "http_headers": {"User-Agent": "Mozilla/5.0"},
+    }
+
+    if settings.ig_ytdlp_cookies and os.path.exists(settings.ig_ytdlp_cookies):
+        cookiefile = _ensure_cookiefile_for_ytdlp(settings.ig_ytdlp_cookies, prefix="ig")
+        if os.path.exists(cookiefile):
+            ydl_opts["cookiefile"] = cookiefile
+    return ydl_opts
+
+
+def _youtube_ydl_opts() -> dict:
+    return {
+        'format': '231+234/bestvideo[height<=480][ext=mp4]+bestaudio/best',  # Explicitly prioritize 231+234
+        'outtmpl': "youtube_shorts_%(id)s.%(ext)s",
+        'merge_output_format': 'mp4',  # Merge into MP4
+        'postprocessors': [{  # Ensure FFmpeg merges video and audio
+            'key': 'FFmpegVideoConvertor',
+            'preferedformat': 'mp4',
+        }],
+        'ffmpeg_location': settings.ffmpeg_path,
+        'quiet': False,  # Enable verbose output for debugging
+        'no_warnings': False,
+    }
+
+
+def _twitter_ydl_opts() -> dict:
+    return {
+        'format': '(mp4)[filesize<20M]/(mp4)[height<=720]/mp4',
+        'outtmpl': "twitter_video_%(id)s.%(ext)s",
+        'quiet': True,
+        'no_warnings': True
+    }
+
+
+def _warm_ydl_pool():
+    """Create one idle YoutubeDL instance per platform. Runs in a worker thread."""
+    for platform, build_opts in (("instagram", _instagram_ydl_opts),
+                                 ("youtube", _youtube_ydl_opts),
+                                 ("twitter", _twitter_ydl_opts)):
+        try:
+            ydl_pool.warm(platform, build_opts())
+        except Exception as e:
+            logger.warning(f"Failed to warm YoutubeDL for {platform}: {e}")
 
-async def download_instagram_via_ytdlp(url: str, chat_id: int, sender: types.User) -> bool:
-    try:
-        await _ig_rate_limit()
-        logger.info(f"Downloading IG via yt-dlp: {url}")
 
-        shortcode = hashlib.sha1(url.encode("utf-8")).hexdigest()[:12]
-        output_template = os.path.join(tempfile.gettempdir(), f"instagram_{shortcode}.%(ext)s")
-
-        ydl_opts = {
-            "format": "mp4[height<=720]/best[ext=mp4]/best",
-            "outtmpl": output_template,
-            "merge_output_format": "mp4",
-            "quiet": True,
-            "no_warnings": True,
-            "retries": 2,
-            "http_headers": {"User-Agent": "Mozilla/5.0"},
-        }
+def _ytdlp_download(platform: str, ydl_opts: dict, url: str, outtmpl: str) -> tuple[dict, str]:
+    """Blocking yt-dlp download with a pooled instance; call it via asyncio.to_thread."""
+    with ydl_pool.checkout(platform, ydl_opts, outtmpl=outtmpl) as ydl:
+        info = ydl.extract_info(url, download=True)
+        return info, ydl.prepare_filename(info)
 
-        if IG_YTDLP_COOKIES and os.path.exists(IG_YTDLP_COOKIES):
-            cookiefile = _ensure_cookiefile_for_ytdlp(IG_YTDLP_COOKIES, prefix="ig")
-            if os.path.exists(cookiefile):
-                ydl_opts["cookiefile"] = cookiefile
 
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            video_file = ydl.prepare_filename(info)
+async def download_instagram_via_ytdlp(url: str, chat_id: int, sender: types.User, key: str | None = None) -> bool:
+    try:
+        key = key or media_key(url)
+        ydl_opts = _instagram_ydl_opts()
+        user_link = f"[{sender.full_name or sender.username}](tg://user?id={sender.id})"
+        caption = f"{user_link} sent [Instagram Reel]({url})"
 
-        if not os.path.exists(video_file):
-            raise FileNotFoundError(f"IG file not found: {video_file}")
+        if await _send_cached_video(key, ydl_opts["format"], chat_id, caption):
+            return True
 
-        # Telegram limit check (50MB)
-        file_size_mb = os.path.getsize(video_file) / (1024 * 1024)
-        if file_size_mb > 50:
-            os.remove(video_file)
-            logger.warning(f"IG file too large ({file_size_mb:.2f}MB), fallback to ddinstagram")
-            return await download_instagram_via_ytdlp(url, chat_id, sender)
+        await _ig_rate_limit()
+        logger.info(f"Downloading IG via yt-dlp: {url}")
 
-        user_link = f"[{sender.full_name or sender.username}](tg://user?id={sender.id})"
-        caption = f"{user_link} sent [Instagram Reel]({url})"
+        output_template = os.path.join(tempfile.gettempdir(), f"{_temp_stem(url, key)}.%(ext)s")
 
-        await bot.send_video(chat_id, FSInputFile(video_file), caption=caption, parse_mode="Markdown")
-        os.remove(video_file)
-        return True
+        async with _stage("instagram.download"):
+            info, video_file = await asyncio.to_thread(
+                _ytdlp_download, "instagram", ydl_opts, url, output_template
+            )
+
+        try:
+            if not os.path.exists(video_file):
+                raise FileNotFoundError(f"IG file not found: {video_file}")
+
+            # Telegram upload limit check (50MB for the public Bot API)
+            file_size_mb = os.path.getsize(video_file) / (1024 * 1024)
+            if file_size_mb > settings.upload_limit_mb:
+                os.remove(video_file)
+                logger.warning(f"IG file too large ({file_size_mb:.2f}MB), fallback to ddinstagram")
+                return await download_instagram_via_ytdlp(url, chat_id, sender, key)
+
+            meta = await _prepare_video(video_file, info)
+            async with _stage("instagram.send"):
+                await bot.send_video(chat_id, _video_input(video_file), caption=caption, parse_mode="Markdown",
+                                     **_send_video_kwargs(meta))
+            await _release_video(video_file, key, ydl_opts["format"], meta)
+            return True
+        finally:
+            _discard_video(video_file)
 
     except Exception as e:
         logger.error(f"IG yt-dlp failed: {e}")
         await notify_admin(url, e, sender, context="IG yt-dlp download failed", message_type="warning")
         # fallback
-        return await download_instagram_via_ytdlp(url, chat_id, sender)
+        return await download_instagram_via_ytdlp(url, chat_id, sender, key)
 
 def _cobalt_base() -> str:
-    if not COBALT_API_URL:
+    api_url = settings.cobalt_api_url
+    if not api_url:
         return ""
-    return COBALT_API_URL if COBALT_API_URL.endswith("/") else (COBALT_API_URL + "/")
+    return api_url if api_url.endswith("/") else (api_url + "/")
 
 def _guess_ext(filename: str | None, url: str | None, default_ext: str = ".mp4") -> str:
     for s in (filename, url):
@@ -333,7 +643,17 @@ async def _http_get_to_file(session: aiohttp.ClientSession, url: str, dest: str,
             async for chunk in resp.content.iter_chunked(1024 * 128):
                 f.write(chunk)
 
-async def download_tiktok_via_cobalt(url: str, chat_id: int, sender: types.User) -> bool:
+async def download_tiktok_via_cobalt(url: str, chat_id: int, sender: types.User, key: str | None = None) -> bool:
+    key = key or media_key(url)
+    cache_fmt = f"cobalt-{settings.cobalt_video_quality}"
+    user_link = f"[{sender.full_name or sender.username}](tg://user?id={sender.id})"
+    caption = f"{user_link} sent [TikTok Video]({url})"
+    try:
+        if await _send_cached_video(key, cache_fmt, chat_id, caption):
+            return True
+    except Exception as e:
+        logger.warning(f"Failed to send cached TikTok {key}: {e}")
+
     base = _cobalt_base()
     if not base:
         logger.warning("COBALT_API_URL is empty; cannot download TikTok via Cobalt")
@@ -342,9 +662,9 @@ async def download_tiktok_via_cobalt(url: str, chat_id: int, sender: types.User)
     try:
         payload = {
             "url": url,
-            "alwaysProxy": bool(COBALT_ALWAYS_PROXY),
+            "alwaysProxy": settings.cobalt_always_proxy,
             "allowH265": True,
-            "videoQuality": COBALT_VIDEO_QUALITY,
+            "videoQuality": settings.cobalt_video_quality,
         }
         headers = {
             "Accept": "application/json",
@@ -353,7 +673,7 @@ async def download_tiktok_via_cobalt(url: str, chat_id: int, sender: types.User)
         }
 
         async with aiohttp.ClientSession() as session:
-            timeout = aiohttp.ClientTimeout(total=COBALT_TIMEOUT_SECONDS)
+            timeout = aiohttp.ClientTimeout(total=settings.cobalt_timeout_seconds)
             async with session.post(base, json=payload, headers=headers, timeout=timeout) as resp:
                 resp.raise_for_status()
                 data = await resp.json(content_type=None)
@@ -383,25 +703,28 @@ async def download_tiktok_via_cobalt(url: str, chat_id: int, sender: types.User)
                 return False
 
             ext = _guess_ext(filename, dl_url, ".mp4")
-            out_path = os.path.join(tempfile.gettempdir(), f"tiktok_{hashlib.sha1(url.encode()).hexdigest()}{ext}")
+            out_path = os.path.join(tempfile.gettempdir(), f"{_temp_stem(url, key)}{ext}")
 
-            await _http_get_to_file(session, dl_url, out_path, timeout_s=COBALT_TIMEOUT_SECONDS)
+            async with _stage("tiktok.download"):
+                await _http_get_to_file(session, dl_url, out_path, timeout_s=settings.cobalt_timeout_seconds)
 
         if not os.path.exists(out_path):
             return False
 
-        file_size_mb = os.path.getsize(out_path) / (1024 * 1024)
-        if file_size_mb > 50:
-            os.remove(out_path)
-            logger.warning(f"TikTok file too large ({file_size_mb:.2f}MB)")
-            return False
-
-        user_link = f"[{sender.full_name or sender.username}](tg://user?id={sender.id})"
-        caption = f"{user_link} sent [TikTok Video]({url})"
+        try:
+            file_size_mb = os.path.getsize(out_path) / (1024 * 1024)
+            if file_size_mb > settings.upload_limit_mb:
+                logger.warning(f"TikTok file too large ({file_size_mb:.2f}MB)")
+                return False
 
-        await bot.send_video(chat_id, FSInputFile(out_path), caption=caption, parse_mode="Markdown")
-        os.remove(out_path)
-        return True
+            meta = await _prepare_video(out_path)
+            async with _stage("tiktok.send"):
+                await bot.send_video(chat_id, _video_input(out_path), caption=caption, parse_mode="Markdown",
+                                     **_send_video_kwargs(meta))
+            await _release_video(out_path, key, cache_fmt, meta)
+            return True
+        finally:
+            _discard_video(out_path)
 
     except Exception as e:
         logger.error(f"Cobalt TikTok failed: {e}")
@@ -409,37 +732,28 @@ async def download_tiktok_via_cobalt(url: str, chat_id: int, sender: types.User)
         return False
 
 
-async def download_youtube_shorts(url: str, chat_id: int, sender: types.User):
+async def download_youtube_shorts(url: str, chat_id: int, sender: types.User, key: str | None = None):
     """Download and send YouTube Shorts to the chat with audio."""
     try:
         logger.info(f"Starting download for YouTube Shorts URL: {url} sent by user: {sender.id}")
 
-        video_id = url.split("/shorts/")[1].split("?")[0]
-        output_template = f"youtube_shorts_{video_id}.%(ext)s"
-        ydl_opts = {
-            'format': '231+234/bestvideo[height<=480][ext=mp4]+bestaudio/best',  # Explicitly prioritize 231+234
-            'outtmpl': output_template,
-            'merge_output_format': 'mp4',  # Merge into MP4
-            'postprocessors': [{  # Ensure FFmpeg merges video and audio
-                'key': 'FFmpegVideoConvertor',
-                'preferedformat': 'mp4',
-            }],
-            'ffmpeg_location': '/usr/bin/ffmpeg',  # Confirmed path for your system
-            'quiet': False,  # Enable verbose output for debugging
-            'no_warnings': False,
-        }
+        key = key or media_key(url)
+        ydl_opts = _youtube_ydl_opts()
+        user_link = f"[{sender.full_name or sender.username}](tg://user?id={sender.id})"
+        caption = f"{user_link} sent [YouTube Shorts]({url})"
 
-        # Debug available formats
-        with yt_dlp.YoutubeDL({'quiet': False, 'no_warnings': False}) as ydl:
-            info = ydl.extract_info(url, download=False)
-            formats = info.get('formats', [])
-            #logger.info(f"Available formats for {url}: {[f'{f.get('format_id')}: {f.get('ext')} {f.get('resolution', 'unknown')} acodec={f.get('acodec', 'none')} vcodec={f.get('vcodec', 'none')} filesize={f.get('filesize_approx', 'unknown')}' for f in formats]}")
+        if await _send_cached_video(key, ydl_opts["format"], chat_id, caption):
+            return True
+
+        output_template = f"{_temp_stem(url, key)}.%(ext)s"
 
         # Download the video
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            video_file = ydl.prepare_filename(info)
+        async with _stage("youtube.download"):
+            info, video_file = await asyncio.to_thread(
+                _ytdlp_download, "youtube", ydl_opts, url, output_template
+            )
 
+        try:
             # Log selected format
             selected_format_id = info.get('format_id', 'unknown')
             logger.info(f"Selected format for {url}: {selected_format_id}")
@@ -448,18 +762,20 @@ async def download_youtube_shorts(url: str, chat_id: int, sender: types.User):
             if not os.path.exists(video_file):
                 raise FileNotFoundError("YouTube Shorts video file not found after download.")
 
-        # Check file size (Telegram limit: 50 MB for regular bots)
-        file_size_mb = os.path.getsize(video_file) / (1024 * 1024)
-        logger.info(f"Downloaded file size for {url}: {file_size_mb:.2f} MB")
-        if file_size_mb > 50:
-            raise ValueError(f"Video file size ({file_size_mb:.2f} MB) exceeds Telegram's 50 MB limit.")
-
-        user_link = f"[{sender.full_name or sender.username}](tg://user?id={sender.id})"
-        caption = f"{user_link} sent [YouTube Shorts]({url})"
-
-        logger.info(f"Sending YouTube Shorts video to chat: {chat_id}")
-        await bot.send_video(chat_id, FSInputFile(video_file), caption=caption, parse_mode="Markdown", width=480, height=854)
-        os.remove(video_file)
+            # Check file size (Telegram limit: 50 MB for regular bots, more with a local Bot API server)
+            file_size_mb = os.path.getsize(video_file) / (1024 * 1024)
+            logger.info(f"Downloaded file size for {url}: {file_size_mb:.2f} MB")
+            if file_size_mb > settings.upload_limit_mb:
+                raise ValueError(f"Video file size ({file_size_mb:.2f} MB) exceeds Telegram's {settings.upload_limit_mb:.0f} MB limit.")
+
+            logger.info(f"Sending YouTube Shorts video to chat: {chat_id}")
+            meta = await _prepare_video(video_file, info)
+            async with _stage("youtube.send"):
+                await bot.send_video(chat_id, _video_input(video_file), caption=caption, parse_mode="Markdown",
+                                     **_send_video_kwargs(meta))
+            await _release_video(video_file, key, ydl_opts["format"], meta)
+        finally:
+            _discard_video(video_file)
         logger.info(f"Successfully sent YouTube Shorts video and cleaned up.")
         return True
     except Exception as e:
@@ -467,13 +783,13 @@ async def download_youtube_shorts(url: str, chat_id: int, sender: types.User):
         await notify_admin(url, e, sender, context="Failed to download YouTube Shorts")
         return False
 
-async def download_twitter_media(url: str, chat_id: int, sender: types.User):
+async def download_twitter_media(url: str, chat_id: int, sender: types.User, key: str | None = None):
     """Download and send Twitter media (video or images) to the chat."""
     try:
         logger.info(f"Processing Twitter URL: {url} sent by user: {sender.id}")
 
         # Спроба завантажити відео через yt_dlp
-        video_success = await download_twitter_video(url, chat_id, sender)
+        video_success = await download_twitter_video(url, chat_id, sender, key)
         if video_success:
             return True
 
@@ -491,41 +807,57 @@ async def download_twitter_media(url: str, chat_id: int, sender: types.User):
         await notify_admin(url, e, sender)
         return False
 
-async def download_twitter_video(url: str, chat_id: int, sender: types.User) -> bool:
+def _twitter_ytdlp_download(url: str, outtmpl: str) -> tuple[dict, str] | None:
+    """Blocking: extract tweet info and download the video if there is one (None if there is none)."""
+    yt_dlp = _load_yt_dlp()
+    with ydl_pool.checkout("twitter", _twitter_ydl_opts(), outtmpl=outtmpl) as ydl:
+        try:
+            info = ydl.extract_info(url, download=False)
+            if 'formats' not in info:
+                return None
+            # Reuse extracted info instead of extracting the tweet a second time
+            ydl.process_ie_result(info, download=True)
+        except yt_dlp.utils.DownloadError:
+            # Tweets without a video (images/text only) end up here
+            return None
+        return info, ydl.prepare_filename(info)
+
+
+async def download_twitter_video(url: str, chat_id: int, sender: types.User, key: str | None = None) -> bool:
     """Download and send Twitter video."""
     try:
-        tweet_id = url.split("/status/")[1].split("?")[0]
-        output_template = f"twitter_video_{tweet_id}.%(ext)s"
-        ydl_opts = {
-            'format': '(mp4)[filesize<20M]/(mp4)[height<=720]/mp4',
-            'outtmpl': output_template,
-            'quiet': True,
-            'no_warnings': True
-        }
+        key = key or media_key(url)
+        cache_fmt = _twitter_ydl_opts()["format"]
+        user_link = f"[{sender.full_name or sender.username}](tg://user?id={sender.id})"
+        caption = f"{user_link} sent [Twitter Video]({url})"
 
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            if 'formats' in info:
-                ydl.download([url])
-                video_file = ydl.prepare_filename(info)
+        if await _send_cached_video(key, cache_fmt, chat_id, caption):
+            return True
 
-                if not os.path.exists(video_file):
-                    raise FileNotFoundError(f"Twitter video file not found: {video_file}")
+        output_template = f"{_temp_stem(url, key)}.%(ext)s"
 
-                user_link = f"[{sender.full_name or sender.username}](tg://user?id={sender.id})"
-                caption = f"{user_link} sent [Twitter Video]({url})"
-                await bot.send_video(chat_id, FSInputFile(video_file), caption=caption, parse_mode="Markdown")
+        async with _stage("twitter.download"):
+            downloaded = await asyncio.to_thread(_twitter_ytdlp_download, url, output_template)
+        if downloaded is None:
+            logger.info(f"No video found in tweet: {url}")
+            return False
+        info, video_file = downloaded
 
-                os.remove(video_file)
-                logger.info(f"Successfully sent Twitter video for tweet: {url}")
-                return True
-            else:
-                logger.info(f"No video found in tweet: {url}")
-                return False
+        try:
+            if not os.path.exists(video_file):
+                raise FileNotFoundError(f"Twitter video file not found: {video_file}")
+
+            meta = await _prepare_video(video_file, info)
+            async with _stage("twitter.send"):
+                await bot.send_video(chat_id, _video_input(video_file), caption=caption, parse_mode="Markdown",
+                                     **_send_video_kwargs(meta))
+
+            await _release_video(video_file, key, cache_fmt, meta)
+        finally:
+            _discard_video(video_file)
+        logger.info(f"Successfully sent Twitter video for tweet: {url}")
+        return True
 
-    except yt_dlp.utils.DownloadError:
-        logger.info(f"No video found in tweet: {url}")
-        return False
     except Exception as e:
         logger.error(f"Error downloading Twitter video for URL: {url}. Error: {e}")
         return False
@@ -548,14 +880,45 @@ async def send_welcome(message: types.Message):
     """Send a welcome message to the admin."""
     sender = message.from_user
     log_user_start(sender.id, sender.username, sender.full_name)
-    if sender.id == int(ADMIN_ID):
-        logger.info(f"Admin {ADMIN_ID} initiated the bot.")
+    if sender.id == settings.admin_id:
+        logger.info(f"Admin {settings.admin_id} initiated the bot.")
         await message.reply("Hi Admin!\nI'm your bot, ready to assist you.")
     user_link = f"[{sender.full_name or sender.username}](tg://user?id={sender.id})"
-    await bot.send_message(ADMIN_ID, f"User {user_link} send /start to bot", parse_mode="Markdown")
+    await bot.send_message(settings.admin_id, f"User {user_link} send /start to bot", parse_mode="Markdown")
     await message.reply(START_MESSAGE_NON_ADMIN, parse_mode="Markdown", disable_web_page_preview=True)
 
 
+async def send_diagnostics_report(text: str):
+    """Log the memory report and send it to the admin."""
+    logger.info(f"Memory diagnostics report:\n{text}")
+    if len(text) > 3900:  # Telegram message limit is 4096
+        text = text[:3900] + "\n..."
+    await bot.send_message(settings.admin_id, f"🧠 Memory report\n```\n{text}\n```", parse_mode="Markdown")
+
+
+@router.message(F.text.startswith("/diag"))
+async def handle_diagnostics(message: types.Message):
+    """Admin command: /diag on | off | report."""
+    if message.from_user.id != settings.admin_id:
+        return
+
+    args = message.text.split()
+    action = args[1] if len(args) > 1 else "report"
+    if action == "on":
+        diagnostics.start(send_diagnostics_report)
+        await message.reply(f"Memory diagnostics on, report every {diagnostics.interval:.0f}s.")
+    elif action == "off":
+        diagnostics.stop()
+        await message.reply("Memory diagnostics off.")
+    elif action == "report":
+        if not diagnostics.enabled:
+            await message.reply("Memory diagnostics are off, send /diag on first.")
+            return
+        await send_diagnostics_report(await asyncio.to_thread(diagnostics.report))
+    else:
+        await message.reply("Usage: /diag on | off | report")
+
+
 @router.message(lambda message: message.text and re.search(INSTAGRAM_REELS_REGEX, message.text))
 async def handle_instagram_reels(message: types.Message):
     """Handle messages containing Instagram Reel links."""
@@ -564,13 +927,21 @@ async def handle_instagram_reels(message: types.Message):
         url = match.group(0)
         sender = message.from_user
         chat_id = message.chat.id
-        log_activity(sender.id, chat_id, instagram=True)
-        log_chat_usage(chat_id, message.chat.title)
-        logger.info(f"Received Instagram Reels link: {url} from user: {sender.id}")
-        success = await download_instagram_via_ytdlp(url, chat_id, sender)
-        if success:
-            logger.info(f"Deleting original message with URL: {url}")
-            await message.delete()
+        key = media_key(url) or url
+
+        with job_context(platform="instagram", chat_id=chat_id, user_id=sender.id, media=key):
+            async with media_job(chat_id, key) as started:
+                if not started:
+                    logger.info(f"Skipping duplicate {key} in chat {chat_id}: already in progress")
+                    return
+
+                log_activity(sender.id, chat_id, instagram=True, media_key=key)
+                log_chat_usage(chat_id, message.chat.title)
+                logger.info(f"Received Instagram Reels link: {url} ({key}) from user: {sender.id}")
+                success = await download_instagram_via_ytdlp(url, chat_id, sender, key)
+                if success:
+                    logger.info(f"Deleting original message with URL: {url}")
+                    await message.delete()
 
 @router.message(lambda message: message.text and re.search(YOUTUBE_SHORTS_REGEX, message.text))
 async def handle_youtube_shorts(message: types.Message):
@@ -580,16 +951,23 @@ async def handle_youtube_shorts(message: types.Message):
         url = match.group(0)
         sender = message.from_user
         chat_id = message.chat.id
+        key = media_key(url) or url
+
+        with job_context(platform="youtube", chat_id=chat_id, user_id=sender.id, media=key):
+            async with media_job(chat_id, key) as started:
+                if not started:
+                    logger.info(f"Skipping duplicate {key} in chat {chat_id}: already in progress")
+                    return
 
-        log_activity(sender.id, chat_id, youtube=True)
-        log_chat_usage(chat_id, message.chat.title)
+                log_activity(sender.id, chat_id, youtube=True, media_key=key)
+                log_chat_usage(chat_id, message.chat.title)
 
-        logger.info(f"Received YouTube Shorts link: {url} from user: {sender.id}")
-        success = await download_youtube_shorts(url, chat_id, sender)
+                logger.info(f"Received YouTube Shorts link: {url} ({key}) from user: {sender.id}")
+                success = await download_youtube_shorts(url, chat_id, sender, key)
 
-        if success:
-            logger.info(f"Deleting original message with URL: {url}")
-            await message.delete()
+                if success:
+                    logger.info(f"Deleting original message with URL: {url}")
+                    await message.delete()
 
 @router.message(lambda message: message.text and re.search(TWITTER_REGEX, message.text))
 async def handle_twitter_media(message: types.Message):
@@ -599,32 +977,47 @@ async def handle_twitter_media(message: types.Message):
         url = match.group(0)
         sender = message.from_user
         chat_id = message.chat.id
+        key = media_key(url) or url
 
-        log_activity(sender.id, chat_id, twitter=True)  # Логування використання функції Twitter
-        log_chat_usage(chat_id, message.chat.title)
+        with job_context(platform="twitter", chat_id=chat_id, user_id=sender.id, media=key):
+            async with media_job(chat_id, key) as started:
+                if not started:
+                    logger.info(f"Skipping duplicate {key} in chat {chat_id}: already in progress")
+                    return
 
-        logger.info(f"Received Twitter link: {url} from user: {sender.id}")
-        success = await download_twitter_media(url, chat_id, sender)
+                log_activity(sender.id, chat_id, twitter=True, media_key=key)  # Логування використання функції Twitter
+                log_chat_usage(chat_id, message.chat.title)
 
-        if success:
-            logger.info(f"Deleting original message with URL: {url}")
-            await message.delete()
+                logger.info(f"Received Twitter link: {url} ({key}) from user: {sender.id}")
+                success = await download_twitter_media(url, chat_id, sender, key)
+
+                if success:
+                    logger.info(f"Deleting original message with URL: {url}")
+                    await message.delete()
 
 @router.message(lambda message: message.text and re.search(TIKTOK_REGEX, message.text))
 async def handle_tiktok(message: types.Message):
     """Обробляє повідомлення з TikTok посиланнями."""
     match = re.search(TIKTOK_REGEX, message.text)
-    if match and len(message.text.split(' ')) == 1 and message.chat.id not in IGNORED_CHATS_FOR_TIKTOK:
+    if match and len(message.text.split(' ')) == 1:
         url = match.group(0)
         sender = message.from_user
         chat_id = message.chat.id
-        log_activity(sender.id, chat_id, tiktok=True)  # Потрібно оновити функцію log_activity
-        log_chat_usage(chat_id, message.chat.title)
-        logger.info(f"Received TikTok link: {url} from user: {sender.id}")
-        success = await download_tiktok_via_cobalt(url, chat_id, sender)
-        if success:
-            logger.info(f"Deleting original message with URL: {url}")
-            await message.delete()
+        key = await resolve_media_key(url) or url
+
+        with job_context(platform="tiktok", chat_id=chat_id, user_id=sender.id, media=key):
+            async with media_job(chat_id, key) as started:
+                if not started:
+                    logger.info(f"Skipping duplicate {key} in chat {chat_id}: already in progress")
+                    return
+
+                log_activity(sender.id, chat_id, tiktok=True, media_key=key)  # Потрібно оновити функцію log_activity
+                log_chat_usage(chat_id, message.chat.title)
+                logger.info(f"Received TikTok link: {url} ({key}) from user: {sender.id}")
+                success = await download_tiktok_via_cobalt(url, chat_id, sender, key)
+                if success:
+                    logger.info(f"Deleting original message with URL: {url}")
+                    await message.delete()
 
 
 @router.message()  # Catch-all handler for any unhandled messages
@@ -635,7 +1028,7 @@ async def forward_to_admin(message: types.Message):
         return
 
     # Prevent forwarding admin's own messages
-    if message.from_user.id == int(ADMIN_ID):
+    if message.from_user.id == settings.admin_id:
         return
 
     sender = message.from_user
@@ -644,7 +1037,7 @@ async def forward_to_admin(message: types.Message):
     try:
         # Forward the original message
         await bot.forward_message(
-            chat_id=ADMIN_ID,
+            chat_id=settings.admin_id,
             from_chat_id=message.chat.id,
             message_id=message.message_id
         )
@@ -663,7 +1056,7 @@ async def forward_to_admin(message: types.Message):
 
         context = f"👆 Message above forwarded from private chat with {user_link}\n\n{user_info}"
 
-        await bot.send_message(ADMIN_ID, context, parse_mode="Markdown")
+        await bot.send_message(settings.admin_id, context, parse_mode="Markdown")
 
         # Log forwarding activity
         log_activity(sender.id, message.chat.id, forwarded=True)
@@ -675,8 +1068,42 @@ async def forward_to_admin(message: types.Message):
 
 async def main():
     """Start the bot."""
+    global bot, media_cache
     logger.info("Bot is starting...")
-    await dp.start_polling(bot)
+    session = None
+    if settings.telegram_api_base:
+        logger.info(f"Using Bot API server {settings.telegram_api_base} (local mode: {settings.telegram_api_local})")
+        session = AiohttpSession(
+            api=TelegramAPIServer.from_base(settings.telegram_api_base, is_local=settings.telegram_api_local)
+        )
+    bot = Bot(token=settings.bot_token, session=session)
+    media_cache = await asyncio.to_thread(_open_media_cache)
+    if settings.diagnostics_enabled:
+        diagnostics.start(send_diagnostics_report)
+    dp.startup.register(_on_startup)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        ydl_pool.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Cortes Telegram bot")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print an import-time breakdown and exit")
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        profile_startup()
+    else:
+        log_listener = setup_logging(
+            log_file=settings.log_file,
+            level=settings.log_level,
+            fmt=settings.log_format,
+            max_bytes=settings.log_max_bytes,
+            backup_count=settings.log_backup_count,
+            debug_sample_rate=settings.log_debug_sample_rate,
+        )
+        try:
+            asyncio.run(main())
+        finally:
+            log_listener.stop()
@@ -0,0 +1,197 @@
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ("user", "chat")
+
+
+@dataclass(frozen=True)
+class Rule:
+    scope: str  # user | chat
+    limit: int
+    window: float  # seconds
+    platform: str = "*"  # instagram | youtube | twitter | tiktok | *
+
+    def applies_to(self, platform: str) -> bool:
+        return self.platform in ("*", platform)
+
+
+@dataclass
+class Policy:
+    rules: list[Rule] = field(default_factory=list)
+    exempt_users: frozenset[int] = frozenset()
+    exempt_chats: frozenset[int] = frozenset()
+    blocked: dict[int, frozenset[str]] = field(default_factory=dict)  # chat_id -> platforms
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Policy":
+        rules = []
+        for raw in data.get("rules", []):
+            rule = Rule(
+                scope=raw["scope"],
+                limit=int(raw["limit"]),
+                window=float(raw["window"]),
+                platform=raw.get("platform", "*"),
+            )
+            if rule.scope not in SCOPES:
+                raise ValueError(f"Unknown rule scope: {rule.scope}")
+            rules.append(rule)
+        return cls(
+            rules=rules,
+            exempt_users=frozenset(int(x) for x in data.get("exempt_users", [])),
+            exempt_chats=frozenset(int(x) for x in data.get("exempt_chats", [])),
+            blocked={int(chat): frozenset(platforms) for chat, platforms in data.get("blocked", {}).items()},
+        )
+
+    def is_blocked(self, chat_id: int, platform: str) -> bool:
+        platforms = self.blocked.get(chat_id)
+        return bool(platforms) and (platform in platforms or "*" in platforms)
+
+
+class PolicyStore:
+    """Policy from a JSON file, reloaded when the file changes (checked at most every `check_interval` s)."""
+
+    def __init__(self, path: str, default: Policy, check_interval: float = 5):
+        self.path = path
+        self.default = default
+        self.check_interval = check_interval
+        self._policy = default
+        self._mtime: float | None = None
+        self._checked_at = 0.0
+        self.reload()
+
+    def reload(self):
+        self._checked_at = time.monotonic()
+        if not self.path:
+            return
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            if self._mtime is not None:
+                logger.warning(f"Throttle policy {self.path} is gone, using defaults")
+                self._policy, self._mtime = self.default, None
+            return
+        if mtime == self._mtime:
+            return
+
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._policy = Policy.from_dict(json.load(f))
+            logger.info(f"Loaded throttle policy from {self.path}: {len(self._policy.rules)} rules")
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # Keep the previous policy: a typo in the file shouldn't open the floodgates
+            logger.error(f"Invalid throttle policy {self.path}, keeping the previous one: {e}")
+        self._mtime = mtime
+
+    def get(self) -> Policy:
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self.reload()
+        return self._policy
+
+
+class SlidingWindowCounters:
+    """
+    Approximate sliding window counters: per key only the current and previous fixed windows
+    are kept (start, previous count, current count), the previous one weighted by its overlap.
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._counters: dict[tuple, list] = {}
+
+    def _window(self, key: tuple, window: float, now: float) -> list:
+        counter = self._counters.get(key)
+        start = now - now % window
+        if counter is None:
+            if len(self._counters) >= self.max_keys:
+                self.purge(now)
+            counter = self._counters[key] = [start, 0, 0]
+        elif counter[0] != start:
+            # Roll over: the current window becomes previous (or both reset after a long pause)
+            counter[1] = counter[2] if start - counter[0] == window else 0
+            counter[2] = 0
+            counter[0] = start
+        return counter
+
+    def rate(self, key: tuple, window: float, now: float) -> float:
+        start, previous, current = self._window(key, window, now)
+        return previous * (1 - (now - start) / window) + current
+
+    def hit(self, key: tuple, window: float, now: float):
+        self._window(key, window, now)[2] += 1
+
+    def purge(self, now: float):
+        """Drop counters idle for more than two windows (key[-1] is the window length)."""
+        stale = [key for key, counter in self._counters.items() if now - counter[0] >= 2 * key[-1]]
+        for key in stale:
+            del self._counters[key]
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Per-user / per-chat / per-platform quotas for messages that would start a download.
+    Over-limit messages are dropped before any handler runs; the sender gets one short
+    notice per window, further messages are dropped silently.
+    """
+
+    def __init__(self, store: PolicyStore, classify: Callable[[Message], str | None],
+                 exempt_users: frozenset[int] = frozenset()):
+        self.store = store
+        self.classify = classify
+        self.exempt_users = exempt_users
+        self.counters = SlidingWindowCounters()
+        self._notified: dict[tuple, float] = {}
+
+    async def __call__(self, handler: Callable[[Message, dict[str, Any]], Awaitable[Any]],
+                       event: Message, data: dict[str, Any]) -> Any:
+        platform = self.classify(event)
+        if platform is None or event.from_user is None:
+            return await handler(event, data)
+
+        policy = self.store.get()
+        user_id, chat_id = event.from_user.id, event.chat.id
+
+        if policy.is_blocked(chat_id, platform):
+            logger.info(f"{platform} is blocked in chat {chat_id}, ignoring message")
+            return None
+        if user_id in self.exempt_users or user_id in policy.exempt_users or chat_id in policy.exempt_chats:
+            return await handler(event, data)
+
+        now = time.monotonic()
+        keys = []
+        for rule in policy.rules:
+            if not rule.applies_to(platform):
+                continue
+            entity = user_id if rule.scope == "user" else chat_id
+            key = (rule.scope, rule.platform, entity, rule.limit, rule.window)
+            if self.counters.rate(key, rule.window, now) >= rule.limit:
+                await self._reject(event, key, rule, now)
+                return None
+            keys.append((key, rule.window))
+
+        for key, window in keys:
+            self.counters.hit(key, window, now)
+        return await handler(event, data)
+
+    async def _reject(self, event: Message, key: tuple, rule: Rule, now: float):
+        logger.info(f"Throttled {rule.scope} {key[2]} ({rule.platform}): {rule.limit} per {rule.window:.0f}s")
+        if self._notified.get(key, 0) > now:
+            return
+        if len(self._notified) > 10_000:
+            self._notified = {k: until for k, until in self._notified.items() if until > now}
+        self._notified[key] = now + rule.window
+        try:
+            await event.reply(f"⏳ Забагато посилань. Спробуй ще раз за {rule.window:.0f} с.")
+        except Exception as e:
+            logger.warning(f"Failed to send throttle notice: {e}")
@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+import shutil
+import struct
+import subprocess
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+PROBE_TIMEOUT_SECONDS = 30
+REMUX_TIMEOUT_SECONDS = 120
+
+# Telegram: thumbnail is a JPEG up to 320px on the longer side and under 200 KB
+THUMBNAIL_MAX_SIDE = 320
+
+
+@dataclass
+class VideoMeta:
+    duration: float | None = None
+    width: int | None = None
+    height: int | None = None
+    thumbnail: str | None = None
+
+
+def find_tool(name: str, configured: str = "") -> str | None:
+    """Configured path if it exists, otherwise look the tool up in PATH."""
+    if configured and os.path.exists(configured):
+        return configured
+    return shutil.which(name)
+
+
+def needs_faststart(path: str) -> bool:
+    """
+    True if the MP4 `moov` atom comes after `mdat`: such files can't start playing
+    until they're fully downloaded. Walks top-level atom headers only.
+    """
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return False
+            size, atom = struct.unpack(">I4s", header)
+            if atom == b"moov":
+                return False
+            if atom == b"mdat":
+                return True
+            if size == 1:  # 64-bit size follows the header
+                size = struct.unpack(">Q", f.read(8))[0]
+                f.seek(size - 16, os.SEEK_CUR)
+            elif size < 8:  # 0: atom runs to the end of file, anything else: not an MP4
+                return False
+            else:
+                f.seek(size - 8, os.SEEK_CUR)
+
+
+def probe(path: str, ffprobe: str) -> VideoMeta | None:
+    """Duration and dimensions of the first video stream, via ffprobe."""
+    cmd = [ffprobe, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=PROBE_TIMEOUT_SECONDS, check=True)
+        data = json.loads(result.stdout)
+    except (subprocess.SubprocessError, OSError, ValueError) as e:
+        logger.warning(f"ffprobe failed for {path}: {e}")
+        return None
+
+    video = next((s for s in data.get("streams", []) if s.get("codec_type") == "video"), None)
+    if video is None:
+        return None
+
+    meta = VideoMeta(width=video.get("width"), height=video.get("height"))
+    # Rotated phone videos: Telegram wants displayed dimensions
+    rotation = int(float((video.get("tags") or {}).get("rotate", 0) or 0))
+    for side_data in video.get("side_data_list", []):
+        rotation = int(side_data.get("rotation", rotation) or 0)
+    if meta.width and meta.height and abs(rotation) % 180 == 90:
+        meta.width, meta.height = meta.height, meta.width
+
+    duration = (data.get("format") or {}).get("duration") or video.get("duration")
+    if duration:
+        meta.duration = float(duration)
+    return meta
+
+
+def remux_faststart(path: str, ffmpeg: str) -> bool:
+    """Stream-copy remux with the moov atom moved to the front. Replaces the file in place."""
+    tmp_path = f"{path}.faststart.mp4"
+    cmd = [ffmpeg, "-v", "error", "-y", "-i", path, "-map", "0", "-c", "copy", "-movflags", "+faststart", tmp_path]
+    try:
+        subprocess.run(cmd, capture_output=True, timeout=REMUX_TIMEOUT_SECONDS, check=True)
+        os.replace(tmp_path, path)
+        return True
+    except (subprocess.SubprocessError, OSError) as e:
+        logger.warning(f"Faststart remux failed for {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+def thumbnail_path(path: str) -> str:
+    """Where make_thumbnail() writes the thumbnail of `path`."""
+    return f"{path}.jpg"
+
+
+def make_thumbnail(path: str, ffmpeg: str, duration: float | None) -> str | None:
+    """Small JPEG frame from the video (1s in, or the first frame for very short clips)."""
+    thumb_path = thumbnail_path(path)
+    seek = "1" if duration and duration > 2 else "0"
+    scale = f"scale={THUMBNAIL_MAX_SIDE}:{THUMBNAIL_MAX_SIDE}:force_original_aspect_ratio=decrease"
+    cmd = [ffmpeg, "-v", "error", "-y", "-ss", seek, "-i", path, "-frames:v", "1", "-vf", scale, "-q:v", "5", thumb_path]
+    try:
+        subprocess.run(cmd, capture_output=True, timeout=PROBE_TIMEOUT_SECONDS, check=True)
+    except (subprocess.SubprocessError, OSError) as e:
+        logger.warning(f"Thumbnail extraction failed for {path}: {e}")
+        return None
+    return thumb_path if os.path.exists(thumb_path) else None
+
+
+def prepare_video(path: str, ffmpeg: str | None, ffprobe: str | None) -> VideoMeta | None:
+    """
+    Post-process a downloaded video before sending: probe once, move moov to the front
+    if needed (so clients can start playback while downloading) and extract a thumbnail.
+    Blocking, run it in a worker thread. Returns None if ffprobe is unavailable or fails.
+    """
+    if not ffprobe:
+        return None
+    meta = probe(path, ffprobe)
+    if meta is None:
+        return None
+
+    if ffmpeg:
+        try:
+            if path.lower().endswith((".mp4", ".m4v", ".mov")) and needs_faststart(path):
+                logger.info(f"Remuxing {path} with +faststart")
+                remux_faststart(path, ffmpeg)
+        except (OSError, struct.error) as e:
+            logger.warning(f"Failed to check atoms of {path}: {e}")
+        meta.thumbnail = make_thumbnail(path, ffmpeg, meta.duration)
+    return meta
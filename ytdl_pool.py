@@ -0,0 +1,146 @@
+import copy
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class _PooledYDL:
+    __slots__ = ("ydl", "default_outtmpl", "created_at", "uses")
+
+    def __init__(self, ydl):
+        self.ydl = ydl
+        self.default_outtmpl = ydl.params["outtmpl"]["default"]
+        self.created_at = time.monotonic()
+        self.uses = 0
+
+
+class YoutubeDLPool:
+    """
+    Long-lived, pre-configured yt_dlp.YoutubeDL instances per (platform, options).
+
+    Instance is checked out exclusively for one job, so it's safe to use from executor threads.
+    Instances are recycled after `max_uses` jobs or `max_age` seconds to bound memory growth
+    (yt-dlp keeps caches, cookie jar and opener state on the instance).
+    """
+
+    def __init__(self, max_idle_per_key: int = 2, max_uses: int = 50, max_age: float = 1800):
+        self.max_idle_per_key = max_idle_per_key
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self._idle: dict[tuple, list[_PooledYDL]] = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.recycled = 0
+        self.in_use = 0
+
+    @staticmethod
+    def _key(platform: str, opts: dict) -> tuple:
+        return platform, json.dumps(opts, sort_keys=True, default=str)
+
+    def _expired(self, entry: _PooledYDL) -> bool:
+        return entry.uses >= self.max_uses or time.monotonic() - entry.created_at >= self.max_age
+
+    def _create(self, platform: str, opts: dict) -> _PooledYDL:
+        import yt_dlp
+
+        # YoutubeDL mutates params (e.g. outtmpl -> dict), so it gets its own copy
+        entry = _PooledYDL(yt_dlp.YoutubeDL(copy.deepcopy(opts)))
+        with self._lock:
+            self.created += 1
+        logger.info(f"Created YoutubeDL instance for {platform}")
+        return entry
+
+    def _close(self, entry: _PooledYDL):
+        try:
+            entry.ydl.close()
+        except Exception as e:
+            logger.warning(f"Failed to close YoutubeDL instance: {e}")
+
+    def _acquire(self, key: tuple, platform: str, opts: dict) -> _PooledYDL:
+        expired = []
+        entry = None
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                candidate = idle.pop()
+                if self._expired(candidate):
+                    expired.append(candidate)
+                    continue
+                entry = candidate
+                break
+            self.recycled += len(expired)
+            self.in_use += 1
+
+        for old in expired:
+            self._close(old)
+        if entry is None:
+            try:
+                entry = self._create(platform, opts)
+            except Exception:
+                with self._lock:
+                    self.in_use -= 1
+                raise
+        return entry
+
+    def _release(self, key: tuple, entry: _PooledYDL, healthy: bool):
+        entry.uses += 1
+        with self._lock:
+            self.in_use -= 1
+            idle = self._idle.setdefault(key, [])
+            keep = healthy and not self._expired(entry) and len(idle) < self.max_idle_per_key
+            if keep:
+                idle.append(entry)
+            else:
+                self.recycled += 1
+        if not keep:
+            self._close(entry)
+
+    @contextmanager
+    def checkout(self, platform: str, opts: dict, outtmpl: str | None = None):
+        """
+        Borrow a YoutubeDL instance for a single job.
+
+        `outtmpl` overrides the default output template for this job only,
+        so per-link filenames don't split the pool into one instance per link.
+        """
+        import yt_dlp
+
+        key = self._key(platform, opts)
+        entry = self._acquire(key, platform, opts)
+        healthy = False
+        try:
+            entry.ydl.params["outtmpl"]["default"] = outtmpl or entry.default_outtmpl
+            yield entry.ydl
+            healthy = True
+        except yt_dlp.utils.DownloadError:
+            # Expected per-link failure (no video, private post...), instance itself is fine
+            healthy = True
+            raise
+        finally:
+            self._release(key, entry, healthy)
+
+    def warm(self, platform: str, opts: dict):
+        """Create an idle instance in advance (extractors, opener, cookie jar get initialized)."""
+        key = self._key(platform, opts)
+        with self._lock:
+            if self._idle.get(key):
+                return
+        entry = self._create(platform, opts)
+        with self._lock:
+            self._idle.setdefault(key, []).append(entry)
+
+    def live_count(self) -> int:
+        """Number of instances owned by the pool (idle + checked out)."""
+        with self._lock:
+            return self.in_use + sum(len(idle) for idle in self._idle.values())
+
+    def close(self):
+        with self._lock:
+            entries = [entry for idle in self._idle.values() for entry in idle]
+            self._idle.clear()
+        for entry in entries:
+            self._close(entry)